@@ -1,3 +1,4 @@
 from .group_chat_agent import GroupChatAgent
+from .reply_cache import SemanticReplyCache
 
-__all__ = ["GroupChatAgent"]
\ No newline at end of file
+__all__ = ["GroupChatAgent", "SemanticReplyCache"]
\ No newline at end of file
@@ -137,6 +137,26 @@ class GroupChatAgent(Agent):
         )
         return memory_id
     
+    def add_memories_bulk(
+        self,
+        items: List[dict],
+        memory_type: str = "working"
+    ) -> List[str]:
+        """
+        批量添加记忆项
+        
+        :param items: 记忆项列表，每项包含 content，可选 user_id、metadata
+        :param memory_type: 记忆类型
+        :return: 创建的记忆项 ID 列表
+        """
+        if not self.memory_manager:
+            raise ValueError("Memory manager is not enabled.")
+        
+        return self.memory_manager.add_memories(
+            items=items,
+            memory_type=memory_type
+        )
+    
     async def run(
         self,
         query: str,
@@ -0,0 +1,84 @@
+from typing import Optional
+import os
+import time
+import uuid
+import hashlib
+
+from loguru import logger
+
+from ..memory.embedding import get_text_embedder, get_dimension
+from ..memory.storage import QdrantConnectionManager
+
+class SemanticReplyCache:
+    """基于向量相似度的回复缓存
+
+    相同群组内语义相近的提问直接复用之前的回答，避免重复调用 LLM。
+    向量存放在 Qdrant 的独立集合中，按 group_id 隔离。
+    """
+
+    def __init__(
+        self,
+        threshold: Optional[float] = None,
+        ttl: Optional[int] = None,
+        collection_name: str = "reply_cache",
+    ):
+        """
+        :param threshold: 命中所需的最低余弦相似度，默认从 REPLY_CACHE_THRESHOLD 环境变量读取（0.93）
+        :param ttl: 缓存有效期（秒），默认从 REPLY_CACHE_TTL 环境变量读取（86400）
+        :param collection_name: Qdrant 集合名称
+        """
+        self.threshold = threshold if threshold is not None else float(os.getenv("REPLY_CACHE_THRESHOLD", "0.93"))
+        self.ttl = ttl if ttl is not None else int(os.getenv("REPLY_CACHE_TTL", "86400"))
+
+        self.embedder = get_text_embedder()
+        self.vector_store = QdrantConnectionManager.get_instance(
+            url=os.getenv("QDRANT_URL", None),
+            api_key=os.getenv("QDRANT_API_KEY", None),
+            collection_name=collection_name,
+            vector_size=get_dimension(getattr(self.embedder, 'dimension', 384)),
+            distance="cosine"
+        )
+
+    @staticmethod
+    def _point_id(group_id: str, query: str) -> str:
+        """同一群组的同一问题映射到固定 ID，重复写入时直接覆盖"""
+        digest = hashlib.sha1(f"{group_id}|{query}".encode("utf-8")).hexdigest()
+        return str(uuid.uuid5(uuid.NAMESPACE_OID, digest))
+
+    def _embed(self, query: str):
+        embedding = self.embedder.encode(query)
+        if hasattr(embedding, 'tolist'):
+            embedding = embedding.tolist()
+        return embedding
+
+    def lookup(self, group_id: str, query: str) -> Optional[str]:
+        """查找语义相近的已缓存回答，未命中或已过期返回 None"""
+        hits = self.vector_store.search_vectors(
+            query=self._embed(query),
+            top_k=1,
+            where={"group_id": str(group_id)},
+            score_threshold=self.threshold,
+        )
+        if not hits:
+            return None
+
+        hit = hits[0]
+        payload = hit["metadata"]
+        if time.time() - payload.get("timestamp", 0) > self.ttl:
+            self.vector_store.delete_vector([hit["id"]])
+            return None
+
+        logger.debug(f"[ReplyCache] 群组 {group_id} 命中缓存 (score={hit['score']:.3f}): {payload.get('query', '')[:30]}")
+        return payload.get("answer")
+
+    def store(self, group_id: str, query: str, answer: str) -> bool:
+        """缓存一次问答"""
+        return self.vector_store.add_vector(
+            vectors=[self._embed(query)],
+            metadatas=[{
+                "group_id": str(group_id),
+                "query": query,
+                "answer": answer,
+            }],
+            ids=[self._point_id(group_id, query)]
+        )
@@ -49,6 +49,17 @@ class BaseMemory(ABC):
         """
         pass
 
+    def add_many(self, memory_items: List[MemoryItem]) -> List[str]:
+        """批量添加记忆项，子类可覆盖以实现真正的批量写入
+        
+        Args:
+            memory_items (List[MemoryItem]): 记忆项对象列表
+            
+        Returns:
+            List[str]: 记忆项ID列表
+        """
+        return [self.add(item) for item in memory_items]
+
     @abstractmethod
     def retrieve(self, query: str, top_k: int = 5) -> List[MemoryItem]:
         """检索相关记忆项
@@ -1,6 +1,10 @@
 from typing import List, Union, Optional
+from collections import OrderedDict
+import asyncio
+import hashlib
 import threading
 import os
+import httpx
 import numpy as np
 from openai import OpenAI, AsyncOpenAI
 
@@ -69,6 +73,8 @@ class OpenAIEmbeddingModel(EmbeddingModel):
         api_key: str = None,
         base_url: str = None,
         timeout: int = 30,
+        batch_size: int = None,
+        cache_size: int = None,
         **kwargs,
     ):
         """初始化嵌入模型
@@ -77,12 +83,16 @@ class OpenAIEmbeddingModel(EmbeddingModel):
         :param api_key: API 密钥，默认从 EMBEDDING_API_KEY 环境变量读取
         :param base_url: API 基础 URL，默认从 EMBEDDING_BASE_URL 环境变量读取
         :param timeout: 超时时间（秒）
+        :param batch_size: 单次请求最多携带的文本条数，默认从 EMBEDDING_BATCH_SIZE 环境变量读取（64）
+        :param cache_size: 进程内 LRU 缓存的向量条数，默认从 EMBEDDING_CACHE_SIZE 环境变量读取（4096），0 表示关闭
         :param kwargs: 其他透传给 AsyncOpenAI 的参数
         """
         self.model = model or os.getenv("EMBEDDING_MODEL", "volcengine-text-embedding-001")
         self.api_key = api_key or os.getenv("EMBEDDING_API_KEY")
         self.base_url = base_url or os.getenv("EMBEDDING_BASE_URL", "https://api.volcengine.com")
         self.timeout = timeout
+        self.batch_size = max(1, int(batch_size or os.getenv("EMBEDDING_BATCH_SIZE", 64)))
+        self.cache_size = int(cache_size if cache_size is not None else os.getenv("EMBEDDING_CACHE_SIZE", 4096))
         self.extra_kwargs = kwargs
 
         if not self.api_key:
@@ -96,8 +106,12 @@ class OpenAIEmbeddingModel(EmbeddingModel):
             **self.extra_kwargs,
         )
         self._async_client: Optional[AsyncOpenAI] = None
+        self._http_client: Optional[httpx.AsyncClient] = None
         # 维度：优先在初始化时通过一次轻量嵌入获取
         self._dimension: Optional[int] = None
+        # 文本向量 LRU 缓存：blake2b(text) -> embedding，相同文本不再重复请求
+        self._cache: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._cache_lock = threading.Lock()
 
         logger.info(f"Initialized OpenAIEmbeddingModel with model: {self.model}")
 
@@ -109,30 +123,81 @@ class OpenAIEmbeddingModel(EmbeddingModel):
 
     @property
     def async_client(self) -> AsyncOpenAI:
-        """懒加载异步客户端"""
+        """懒加载异步客户端（复用 HTTP/2 连接池，避免每次请求重新握手）"""
         if self._async_client is None:
+            self._http_client = httpx.AsyncClient(
+                http2=True,
+                limits=httpx.Limits(max_connections=32, max_keepalive_connections=16),
+                timeout=httpx.Timeout(self.timeout, connect=3.0),
+            )
             self._async_client = AsyncOpenAI(
                 api_key=self.api_key,
                 base_url=self.base_url,
                 timeout=self.timeout,
+                http_client=self._http_client,
                 **self.extra_kwargs,
             )
         return self._async_client
 
-    async def _encode_one(self, text: str):
-        """编码单条文本，返回一维向量(list[float])"""
-        resp = await self.async_client.embeddings.create(model=self.model, input=[text])
-        emb = resp.data[0].embedding
-        if self._dimension is None:
-            self._dimension = len(emb)
+    async def aclose(self):
+        """关闭异步客户端及其连接池"""
+        if self._async_client is not None:
+            await self._async_client.close()
+            self._async_client = None
+            self._http_client = None
+
+    @staticmethod
+    def _cache_key(text: str) -> str:
+        return hashlib.blake2b(text.encode("utf-8"), digest_size=16).hexdigest()
+
+    def _cache_get(self, text: str) -> Optional[List[float]]:
+        key = self._cache_key(text)
+        with self._cache_lock:
+            emb = self._cache.get(key)
+            if emb is not None:
+                self._cache.move_to_end(key)
         return emb
 
-    async def _encode_many(self, texts: List[str]):
-        resp = await self.async_client.embeddings.create(model=self.model, input=texts)
-        embs = [item.embedding for item in resp.data]
+    def _cache_put_many(self, texts: List[str], embs: List[List[float]]):
+        if self.cache_size <= 0:
+            return
+        with self._cache_lock:
+            for text, emb in zip(texts, embs):
+                key = self._cache_key(text)
+                self._cache[key] = emb
+                self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _partition(self, texts: List[str]):
+        """查询缓存，返回 (按输入顺序的命中结果，未命中为 None, 需要请求的去重文本)"""
+        results = [self._cache_get(t) for t in texts]
+        pending = list(dict.fromkeys(t for t, r in zip(texts, results) if r is None))
+        return results, pending
+
+    def _merge(self, texts: List[str], results: list, pending: List[str], embs: List[List[float]]):
+        """写回缓存并按输入顺序组装结果"""
         if self._dimension is None and embs:
             self._dimension = len(embs[0])
-        return embs
+        self._cache_put_many(pending, embs)
+        fetched = dict(zip(pending, embs))
+        return [r if r is not None else fetched[t] for t, r in zip(texts, results)]
+
+    def _batches(self, texts: List[str]) -> List[List[str]]:
+        """按 batch_size 切分文本，每批对应一次 API 请求"""
+        return [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+
+    async def _encode_many(self, texts: List[str]):
+        """批量编码，只请求未命中缓存的文本；每 batch_size 条合并为一次请求，批次之间并发发送"""
+        results, pending = self._partition(texts)
+        embs = []
+        if pending:
+            responses = await asyncio.gather(*(
+                self.async_client.embeddings.create(model=self.model, input=batch)
+                for batch in self._batches(pending)
+            ))
+            embs = [item.embedding for resp in responses for item in resp.data]
+        return self._merge(texts, results, pending, embs)
 
     async def aencode(self, texts: Union[str, List[str]]):
         """异步编码接口
@@ -141,27 +206,22 @@ class OpenAIEmbeddingModel(EmbeddingModel):
         :return: 若输入为 str，返回 list[float]；若输入为 list[str]，返回 list[list[float]]
         """
         if isinstance(texts, str):
-            return await self._encode_one(texts)
+            return (await self._encode_many([texts]))[0]
         return await self._encode_many(texts)
 
     def encode(self, texts: Union[str, List[str]]):
         """同步编码接口（直接使用同步 OpenAI 客户端）"""
 
         if isinstance(texts, str):
-            resp = self.sync_client.embeddings.create(model=self.model, input=[texts])
-            emb = resp.data[0].embedding
-            # 首次同步嵌入时记录向量维度
-            if self._dimension is None:
-                self._dimension = len(emb)
-            return emb
-
-        # 多条文本
-        resp = self.sync_client.embeddings.create(model=self.model, input=texts)
-        embs = [item.embedding for item in resp.data]
-        # 也可以通过多条文本的首个向量来初始化维度
-        if self._dimension is None and embs:
-            self._dimension = len(embs[0])
-        return embs
+            return self.encode([texts])[0]
+
+        results, pending = self._partition(texts)
+        # 未命中缓存的文本按 batch_size 分批请求，避免超出服务端单次输入上限
+        embs = []
+        for batch in self._batches(pending):
+            resp = self.sync_client.embeddings.create(model=self.model, input=batch)
+            embs.extend(item.embedding for item in resp.data)
+        return self._merge(texts, results, pending, embs)
 
     @property
     def dimension(self) -> int:
@@ -258,6 +318,13 @@ def get_text_embedder() -> EmbeddingModel:
         return _embedder
 
 
+async def aclose_text_embedder():
+    """关闭全局嵌入实例持有的异步连接（未初始化时不做任何事）"""
+    embedder = _embedder
+    if embedder is not None and hasattr(embedder, "aclose"):
+        await embedder.aclose()
+
+
 def get_dimension(default: int = 384) -> int:
     """获取统一向量维度（失败回退默认值）"""
     try:
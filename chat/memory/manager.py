@@ -88,6 +88,39 @@ class MemoryManager:
         else:
             raise ValueError(f"不支持的记忆类型: {memory_type}")
         
+    def add_memories(
+        self,
+        items: List[Dict[str, Any]],
+        memory_type: str = "working",
+    ) -> List[str]:
+        """
+        批量添加记忆项，返回记忆 ID 列表
+        
+        :param items: 记忆项列表，每项包含 content，可选 user_id、metadata
+        :param memory_type: 记忆类型（working, episodic, semantic）
+        :return: 记忆 ID 列表
+        """
+        if memory_type not in self.memory_types:
+            raise ValueError(f"不支持的记忆类型: {memory_type}")
+
+        now = datetime.now()
+        memory_items = [
+            MemoryItem(
+                id=str(uuid.uuid4()),
+                content=item["content"],
+                memory_type=memory_type,
+                group_id=self.group_id,
+                user_id=item.get("user_id", "default_user"),
+                timestamp=now,
+                metadata=item.get("metadata") or {},
+            )
+            for item in items
+        ]
+
+        memory_ids = self.memory_types[memory_type].add_many(memory_items)
+        logger.debug(f"批量添加 {len(memory_ids)} 条记忆项到 {memory_type} 记忆")
+        return memory_ids
+        
     def retrieve_memory(
         self,
         query: str,
@@ -141,11 +174,12 @@ class MemoryManager:
             working_memory: WorkingMemory = self.memory_types["working"]  # type: ignore
             episodic_memory: EpisodicMemory = self.memory_types["episodic"]  # type: ignore
 
-            @working_memory.on_forget
-            def transfer_to_episodic(item: MemoryItem):
-                item.memory_type = "episodic"
-                episodic_memory.add(item)
-                logger.info(f"工作记忆遗忘，已转移到情景记忆，ID: {item.id}")
+            @working_memory.on_forget_batch
+            def transfer_to_episodic(items: List[MemoryItem]):
+                for item in items:
+                    item.memory_type = "episodic"
+                episodic_memory.add_many(items)
+                logger.info(f"工作记忆遗忘，已批量转移 {len(items)} 条到情景记忆")
     
     async def consolidate_memories(self, llm_client: Optional[LLMClient] = None, limit: int = 10):
         """
@@ -153,17 +187,18 @@ class MemoryManager:
         
         :param llm_client: LLM 客户端实例 (需支持 .async_client.chat.completions.create)
         :param limit: 每次处理的记忆数量
+        :return: 本次被标记为已整理的情景记忆数量
         """
         if "episodic" not in self.memory_types or "semantic" not in self.memory_types:
             logger.warning("情景记忆或语义记忆未启用，无法进行整理")
-            return
+            return 0
         
         if llm_client is None:
             try:
                 llm_client = LLMClient()
             except Exception as e:
                 logger.error(f"无法初始化 LLMClient: {e}")
-                return
+                return 0
 
         episodic = self.memory_types["episodic"]
         semantic = self.memory_types["semantic"]
@@ -171,7 +206,7 @@ class MemoryManager:
         # 1. 获取未整理的记忆
         memories = episodic.get_unconsolidated_memories(limit=limit)
         if not memories:
-            return
+            return 0
 
         logger.info(f"开始批量整理 {len(memories)} 条情景记忆...")
         
@@ -362,6 +397,8 @@ class MemoryManager:
         if total_processed > 0:
             logger.info(f"成功整理 {total_processed} 条情景记忆")
 
+        return total_processed
+
     def get_unconsolidated_count(self) -> int:
         """获取未整理的情景记忆数量"""
         if "episodic" in self.memory_types:
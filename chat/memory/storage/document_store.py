@@ -24,6 +24,11 @@ class DocumentStore(ABC):
         """添加记忆文档"""
         pass
 
+    @abstractmethod
+    def add_memories(self, memories: List[Dict[str, Any]]):
+        """批量添加记忆文档，字段与 add_memory 参数一致"""
+        pass
+
     @abstractmethod
     def get_memory(self, memory_id: str) -> Optional[Dict[str, Any]]:
         """获取记忆文档"""
@@ -195,6 +200,39 @@ class SQLiteDocumentStore(DocumentStore):
 
         conn.commit()
         return memory_id
+
+    def add_memories(self, memories: List[Dict[str, Any]]):
+        """批量添加记忆文档（单事务 executemany）"""
+        if not memories:
+            return []
+
+        conn = self.connection
+        cursor = conn.cursor()
+
+        cursor.executemany(
+            'INSERT OR IGNORE INTO groups (id, name) VALUES (?, ?)',
+            [(gid, gid) for gid in {m["group_id"] for m in memories}]
+        )
+
+        cursor.executemany("""
+            INSERT OR REPLACE INTO memories
+            (id, user_id, group_id, content, memory_type, timestamp, properties, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+        """, [
+            (
+                m["memory_id"],
+                m["user_id"],
+                m["group_id"],
+                m["content"],
+                m["memory_type"],
+                m["timestamp"],
+                json.dumps(m["properties"]) if m.get("properties") else None
+            )
+            for m in memories
+        ])
+
+        conn.commit()
+        return [m["memory_id"] for m in memories]
     
     def get_memory(self, memory_id) -> Optional[Dict[str, Any]]:
         """获取记忆文档"""
@@ -80,6 +80,50 @@ class EpisodicMemory(BaseMemory):
         
         return memory_item.id
 
+    def add_many(self, memory_items: List[MemoryItem]) -> List[str]:
+        """批量添加情景记忆：一次 SQLite 事务 + 一次批量嵌入 + 一次向量 upsert"""
+        if not memory_items:
+            return []
+
+        for item in memory_items:
+            if "consolidated" not in item.metadata:
+                item.metadata["consolidated"] = False
+
+        # 1）权威存储（SQLite）
+        self.doc_store.add_memories([
+            {
+                "memory_id": item.id,
+                "user_id": item.user_id,
+                "group_id": item.group_id,
+                "content": item.content,
+                "memory_type": self.memory_type,
+                "timestamp": int(item.timestamp.timestamp()),
+                "properties": item.metadata,
+            }
+            for item in memory_items
+        ])
+
+        # 2）向量存储（Qdrant）
+        try:
+            embeddings = self.embedder.encode([item.content for item in memory_items])
+            embeddings = [e.tolist() if hasattr(e, 'tolist') else e for e in embeddings]
+
+            self.vector_store.add_vector(
+                vectors=embeddings,
+                metadatas=[{
+                    "memory_id": item.id,
+                    "memory_type": self.memory_type,
+                    "user_id": item.user_id,
+                    "group_id": item.group_id,
+                    "content": item.content
+                } for item in memory_items],
+                ids=[item.id for item in memory_items]
+            )
+        except Exception as e:
+            logger.error(f"[Memory] Failed to add vectors for {len(memory_items)} memories: {e}")
+
+        return [item.id for item in memory_items]
+
     def retrieve(self, query: str, top_k: int = 5, **kwargs) -> List[MemoryItem]:
         """检索相关情景记忆"""
         user_id = kwargs.get("user_id", None)
@@ -1,6 +1,8 @@
 from typing import List, Dict, Any, Callable
 from datetime import datetime, timedelta
 
+from loguru import logger
+
 from ..base import BaseMemory, MemoryItem, MemoryConfig
 
 class WorkingMemory(BaseMemory):
@@ -17,6 +19,7 @@ class WorkingMemory(BaseMemory):
         self.memories: List[MemoryItem] = []
 
         self._forget_handlers: List[Callable[[MemoryItem], None]] = []
+        self._forget_batch_handlers: List[Callable[[List[MemoryItem]], None]] = []
 
 
     def add(self, memory_item: MemoryItem) -> str:
@@ -31,6 +34,18 @@ class WorkingMemory(BaseMemory):
 
         return memory_item.id
     
+    def add_many(self, memory_items: List[MemoryItem]) -> List[str]:
+        """批量添加工作记忆，只做一次容量检查"""
+        if not memory_items:
+            return []
+
+        self.memories.extend(memory_items)
+        self.current_tokens += sum(len(item.content.split()) for item in memory_items)
+
+        self._enforce_capacity_limits()
+
+        return [item.id for item in memory_items]
+    
     def retrieve(self, query: str, limit: int = 5, group_id:str = None, user_id:str = None, **kwargs) -> List[MemoryItem]:
         """检索相关工作记忆"""
         if not self.memories:
@@ -128,15 +143,25 @@ class WorkingMemory(BaseMemory):
 
     def _enforce_capacity_limits(self):
         """强制执行容量限制"""
+        forgotten: List[MemoryItem] = []
+
         # 检查记忆数量限制
         while len(self.memories) > self.max_capacity:
-            self._remove_lowest_priority_memory()
+            self._remove_lowest_priority_memory(forgotten)
         
         # 检查token限制
-        while self.current_tokens > self.max_tokens:
-            self._remove_lowest_priority_memory()
-
-    def _remove_lowest_priority_memory(self):
+        while self.current_tokens > self.max_tokens and self.memories:
+            self._remove_lowest_priority_memory(forgotten)
+
+        # 批量回调：一次容量检查中被遗忘的记忆合并交给批量处理器
+        if forgotten:
+            for hander in self._forget_batch_handlers:
+                try:
+                    hander(forgotten)
+                except Exception as e:
+                    logger.warning(f"忘记记忆回调出错: {e}")
+
+    def _remove_lowest_priority_memory(self, forgotten: List[MemoryItem] = None):
         """删除最久远的一条工作记忆并更新token计数"""
         if not self.memories:
             return
@@ -150,7 +175,10 @@ class WorkingMemory(BaseMemory):
             try:
                 hander(oldest)
             except Exception as e:
-                print(f"忘记记忆回调出错: {e}")
+                logger.warning(f"忘记记忆回调出错: {e}")
+
+        if forgotten is not None:
+            forgotten.append(oldest)
 
         # 更新当前Token数，确保不为负
         self.current_tokens -= len(oldest.content.split())
@@ -160,4 +188,9 @@ class WorkingMemory(BaseMemory):
     def on_forget(self, func: Callable[[MemoryItem], None]):
         """装饰器钩子，当记忆被遗忘时回调"""
         self._forget_handlers.append(func)
+        return func
+
+    def on_forget_batch(self, func: Callable[[List[MemoryItem]], None]):
+        """装饰器钩子，一次容量检查中被遗忘的记忆以列表形式批量回调"""
+        self._forget_batch_handlers.append(func)
         return func
\ No newline at end of file
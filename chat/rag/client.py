@@ -4,11 +4,28 @@ import hashlib
 import sqlite3
 import time
 import json
+import re
 from ..memory.embedding import get_text_embedder, get_dimension
 from ..memory.storage.qdrant_store import QdrantVectorStore
 
 from loguru import logger
 
+# 与 TextSplitter._is_cjk 相同的码位范围，整段文本一次 findall 即可统计
+_CJK_RE = re.compile(
+    '[\u4E00-\u9FFF\u3400-\u4DBF\U00020000-\U0002A6DF\U0002A700-\U0002B73F'
+    '\U0002B740-\U0002B81F\U0002B820-\U0002CEAF\uF900-\uFAFF]'
+)
+
+# markdown 预处理用到的正则，模块加载时编译一次
+_MD_HEADER_RE = re.compile(r'^#{1,6}\s+', flags=re.MULTILINE)
+_MD_LINK_RE = re.compile(r'\[([^\]]+)\]\([^)]+\)')
+_MD_BOLD_RE = re.compile(r'\*\*([^*]+)\*\*')
+_MD_ITALIC_RE = re.compile(r'\*([^*]+)\*')
+_MD_INLINE_CODE_RE = re.compile(r'`([^`]+)`')
+_MD_CODE_BLOCK_RE = re.compile(r'```[^\n]*\n([\s\S]*?)```')
+_BLANK_LINES_RE = re.compile(r'\n\s*\n')
+_SPACES_RE = re.compile(r'[ \t]+')
+
 
 class DocumentLoader:
     def __init__(self):
@@ -226,7 +243,7 @@ class TextSplitter:
     @staticmethod
     def _approx_token_len(text: str) -> int:
         # 近似估计：CJK字符按1 token，其他按空白分词
-        cjk = sum(1 for ch in text if TextSplitter._is_cjk(ch))
+        cjk = len(_CJK_RE.findall(text))
         non_cjk_tokens = len([t for t in text.split() if t])
         return cjk + non_cjk_tokens
     
@@ -388,25 +405,23 @@ class StorageManager:
         预处理 markdown 文本来获得更好的嵌入质量
         移除多余的标记，保留语义内容
         """
-        import re
-
         # Remove markdown headers symbols but keep the text
-        text = re.sub(r'^#{1,6}\s+', '', text, flags=re.MULTILINE)
+        text = _MD_HEADER_RE.sub('', text)
         
         # Remove markdown links but keep the text
-        text = re.sub(r'\[([^\]]+)\]\([^)]+\)', r'\1', text)
+        text = _MD_LINK_RE.sub(r'\1', text)
         
         # Remove markdown emphasis markers
-        text = re.sub(r'\*\*([^*]+)\*\*', r'\1', text)  # bold
-        text = re.sub(r'\*([^*]+)\*', r'\1', text)      # italic
-        text = re.sub(r'`([^`]+)`', r'\1', text)        # inline code
+        text = _MD_BOLD_RE.sub(r'\1', text)         # bold
+        text = _MD_ITALIC_RE.sub(r'\1', text)       # italic
+        text = _MD_INLINE_CODE_RE.sub(r'\1', text)  # inline code
         
         # Remove markdown code blocks but keep content
-        text = re.sub(r'```[^\n]*\n([\s\S]*?)```', r'\1', text)
+        text = _MD_CODE_BLOCK_RE.sub(r'\1', text)
         
         # Remove excessive whitespace
-        text = re.sub(r'\n\s*\n', '\n\n', text)
-        text = re.sub(r'[ \t]+', ' ', text)
+        text = _BLANK_LINES_RE.sub('\n\n', text)
+        text = _SPACES_RE.sub(' ', text)
         
         return text.strip()
 
@@ -1,4 +1,8 @@
-from typing import Dict
+import asyncio
+import os
+import threading
+from typing import Dict, Optional
+from cachetools import TTLCache
 from nonebot import on_command, on_message, get_driver, logger, require
 from nonebot.adapters.onebot.v11 import Bot, Event, Message, GroupMessageEvent, MessageSegment
 from utils.rules import allow_group_rule, group_owner_admin_rule
@@ -8,38 +12,60 @@ from nonebot.rule import to_me
 
 from plugins.group_msg_collect import MessageRecorderAPI
 from plugins.group_msg_collect import on_message_save
-from chat.agents import GroupChatAgent
+from chat.agents import GroupChatAgent, SemanticReplyCache
 from chat.core.llm import LLMClient
 from chat.core.config import Config
 from chat.memory import MemoryConfig
+from chat.memory.embedding import aclose_text_embedder
+
+# 出错时回复给用户的固定文案，具体异常只写日志
+_ERR_MSG = "抱歉，发生错误了 😢 请稍后再试或联系管理员。"
+_DEBUG_ERR_MSG = "抱歉，获取调试信息时发生错误 😢 请稍后再试或联系管理员。"
 
 # 全局 Agent 缓存：group_id -> GroupChatAgent
 group_agents: Dict[str, GroupChatAgent] = {}
 
-def get_group_agent(group_id: str) -> GroupChatAgent:
-    """获取或创建群组对应的 Agent"""
-    if group_id not in group_agents:
-        logger.info(f"正在为群组 {group_id} 初始化新的 GroupChatAgent")
-        
-        # 1. 初始化 LLM (建议从 NoneBot 配置或环境变量读取)
-        # 这里假设 LLMClient 会自动读取环境变量 OPENAI_API_KEY 等
-        llm_client = LLMClient()
-        
-        # 2. 初始化配置
-        config = Config()
-        memory_config = MemoryConfig() # 默认使用 ./memory_data 目录
-        
-        # 3. 创建 Agent
-        agent = GroupChatAgent(
-            name="HiasBot",  # 机器人名字
-            llm=llm_client,
-            group_id=group_id,
-            config=config,
-            memory_config=memory_config,
-            enable_memory=True
-        )
-        group_agents[group_id] = agent
-        
+# 每个群组的初始化锁，避免并发消息重复创建同一群组的 Agent
+_init_locks: Dict[str, asyncio.Lock] = {}
+_init_locks_guard = threading.Lock()
+
+def _build_agent(group_id: str) -> GroupChatAgent:
+    """构造群组对应的 Agent（涉及存储初始化，耗时较长，在线程中执行）"""
+    logger.info(f"正在为群组 {group_id} 初始化新的 GroupChatAgent")
+
+    # 1. 初始化 LLM (建议从 NoneBot 配置或环境变量读取)
+    # 这里假设 LLMClient 会自动读取环境变量 OPENAI_API_KEY 等
+    llm_client = LLMClient()
+
+    # 2. 初始化配置
+    config = Config()
+    memory_config = MemoryConfig() # 默认使用 ./memory_data 目录
+
+    # 3. 创建 Agent
+    return GroupChatAgent(
+        name="HiasBot",  # 机器人名字
+        llm=llm_client,
+        group_id=group_id,
+        config=config,
+        memory_config=memory_config,
+        enable_memory=True
+    )
+
+def _get_init_lock(group_id: str) -> asyncio.Lock:
+    with _init_locks_guard:
+        return _init_locks.setdefault(group_id, asyncio.Lock())
+
+async def get_group_agent_async(group_id: str) -> GroupChatAgent:
+    """获取或创建群组对应的 Agent（并发安全，构造过程不阻塞事件循环）"""
+    agent = group_agents.get(group_id)
+    if agent is not None:
+        return agent
+
+    async with _get_init_lock(group_id):
+        # 双重检查：等待锁期间可能已被其他协程创建
+        if group_id not in group_agents:
+            group_agents[group_id] = await asyncio.to_thread(_build_agent, group_id)
+
     return group_agents[group_id]
 
 __plugin_meta__ = PluginMetadata(
@@ -52,30 +78,80 @@ __plugin_meta__ = PluginMetadata(
 chat_at = on_message(rule=to_me() & allow_group_rule, priority=10, block=False)
 
 
+# 群消息写入记忆的批处理队列：group_id -> Queue[(user_id, message_str)]
+_memory_queues: Dict[str, asyncio.Queue] = {}
+_drain_tasks: Dict[str, asyncio.Task] = {}
+
+# 单批最多写入条数 / 攒批等待时间（秒）
+MEMORY_BATCH_SIZE = 32
+MEMORY_DEBOUNCE_SECONDS = 0.5
+
+async def _save_batch(group_id: str, batch: list):
+    """将一批群消息一次性写入 Working Memory"""
+    items = [
+        {
+            "content": message_str,
+            "user_id": user_id,
+            "metadata": {"source": "group_chat_stream"},
+        }
+        for user_id, message_str in batch
+    ]
+    try:
+        agent = await get_group_agent_async(group_id)
+        # 将群聊消息存入 Working Memory 作为上下文
+        # 注意：这里只存不回复
+        # 超出容量时会触发遗忘并写入情景记忆（SQLite、嵌入请求、向量库），在线程中执行
+        await asyncio.to_thread(agent.add_memories_bulk, items)
+    except Exception as e:
+        logger.warning(f"批量保存群消息到记忆失败 ({len(batch)} 条): {e}")
+
+async def _drain(group_id: str):
+    """后台消费群消息队列，攒批后一次性写入 Working Memory"""
+    queue = _memory_queues[group_id]
+    loop = asyncio.get_running_loop()
+    batch = []
+
+    try:
+        while True:
+            batch = [await queue.get()]
+            deadline = loop.time() + MEMORY_DEBOUNCE_SECONDS
+
+            while len(batch) < MEMORY_BATCH_SIZE:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            await _save_batch(group_id, batch)
+            batch = []
+    except asyncio.CancelledError:
+        # 关闭时写入仍在攒批窗口内的消息以及队列中剩余的消息
+        while not queue.empty():
+            batch.append(queue.get_nowait())
+        if batch:
+            await _save_batch(group_id, batch)
+        raise
+
 @on_message_save
 def handle_new_message(message, message_str):
     """
-    处理新消息，写入记忆
+    处理新消息，投递到群组队列，由后台任务批量写入记忆
 
     :param message: 消息对象
     :param message_str: 消息文本
     """
-    try:
-        target_group = str(message.get("group_id"))
-        user_id = str(message.get("user_id", "unknown"))
-        
-        agent = get_group_agent(target_group)
-        
-        # 将群聊消息存入 Working Memory 作为上下文
-        # 注意：这里只存不回复
-        agent.add_memory(
-            content=message_str,
-            memory_type="working",
-            user_id=user_id,
-            metadata={"source": "group_chat_stream"}
-        )
-    except Exception as e:
-        logger.warning(f"保存群消息到记忆失败: {e}")
+    target_group = str(message.get("group_id"))
+    user_id = str(message.get("user_id", "unknown"))
+
+    queue = _memory_queues.get(target_group)
+    if queue is None:
+        queue = _memory_queues[target_group] = asyncio.Queue()
+        _drain_tasks[target_group] = asyncio.get_running_loop().create_task(_drain(target_group))
+
+    queue.put_nowait((user_id, message_str))
 
 driver = get_driver()
 
@@ -84,11 +160,70 @@ async def startup():
     # 启动初始化 如果需要
     pass
 
+@driver.on_shutdown
+async def shutdown():
+    # 停止各群的记忆写入任务，未写入的消息在任务退出前写完
+    tasks = list(_drain_tasks.values())
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    _drain_tasks.clear()
+
+    # 关闭嵌入模型的 HTTP 连接池
+    await aclose_text_embedder()
+
+# 祖先链缓存：message_id -> 该消息及其祖先的文本，连续追问时避免重复查库
+# 只缓存向上的祖先链：已记录消息的祖先不会再变化，而回复它的消息会不断增加
+_chain_cache: TTLCache = TTLCache(maxsize=4096, ttl=600)
+
 def get_reply_chain(message_id: str) -> list[str]:
-    """获取消息回复链的文本内容"""
-    # 假设 MessageRecorderAPI 返回的是字符串列表，如果不是需要转换
-    reply_chain = MessageRecorderAPI.get_reply_chain(message_id)
-    return [str(msg) for msg in reply_chain]
+    """获取消息及其祖先组成的回复链文本（不含其他用户对该消息的回复分支）"""
+    cached = _chain_cache.get(message_id)
+    if cached is not None:
+        return list(cached)
+
+    reply_chain = MessageRecorderAPI.get_reply_ancestors(message_id)
+    chain_texts = tuple(str(msg) for msg in reply_chain)
+    # 查不到时消息可能尚未入库，不缓存空结果
+    if chain_texts:
+        _chain_cache[message_id] = chain_texts
+    return list(chain_texts)
+
+
+# 语义回复缓存：同群内语义相近的独立提问直接复用回答
+REPLY_CACHE_ENABLED = os.getenv("REPLY_CACHE_ENABLED", "true").lower() == "true"
+_reply_cache: Optional[SemanticReplyCache] = None
+_reply_cache_guard = threading.Lock()
+
+def _get_reply_cache() -> Optional[SemanticReplyCache]:
+    """懒加载回复缓存（涉及向量库连接，在线程中调用）；初始化失败后不再重试"""
+    global _reply_cache, REPLY_CACHE_ENABLED
+    if not REPLY_CACHE_ENABLED:
+        return None
+    with _reply_cache_guard:
+        if _reply_cache is None and REPLY_CACHE_ENABLED:
+            try:
+                _reply_cache = SemanticReplyCache()
+            except Exception as e:
+                REPLY_CACHE_ENABLED = False
+                logger.warning(f"回复缓存初始化失败，已禁用: {e}")
+        return _reply_cache
+
+def _lookup_cached_reply(group_id: str, query: str) -> Optional[str]:
+    try:
+        cache = _get_reply_cache()
+        return cache.lookup(group_id, query) if cache else None
+    except Exception as e:
+        logger.warning(f"查询回复缓存失败: {e}")
+        return None
+
+def _store_cached_reply(group_id: str, query: str, answer: str):
+    try:
+        cache = _get_reply_cache()
+        if cache:
+            cache.store(group_id, query, answer)
+    except Exception as e:
+        logger.warning(f"写入回复缓存失败: {e}")
 
 
 @chat_at.handle()
@@ -101,24 +236,36 @@ async def handle_chat(bot: Bot, event: GroupMessageEvent):
         if not query:
             await chat_at.finish()
 
-        agent = get_group_agent(group_id)
-        reply_context = get_reply_chain(str(event.message_id))
+        agent = await get_group_agent_async(group_id)
+        # 当前消息由记录器异步批量入库，此时可能尚未写入，因此从被回复的消息开始取回复链
+        # （当前消息内容本身即 query）
+        reply_context = get_reply_chain(str(event.reply.message_id)) if event.reply else []
         
-        # 调用 Agent 进行回复
-        # 注意：run 方法内部会自动将 query 和 response 存入 memory
-        answer = await agent.run(
-            query=query,
-            reply_string=reply_context
-        )
+        # 没有回复任何消息时才是独立提问，可以走语义缓存；
+        # 追问依赖上下文，即使被回复的消息未被记录、回复链为空也不缓存
+        use_cache = event.reply is None
+        answer = None
+        if use_cache:
+            answer = await asyncio.to_thread(_lookup_cached_reply, group_id, query)
+
+        if answer is None:
+            # 调用 Agent 进行回复
+            # 注意：run 方法内部会自动将 query 和 response 存入 memory
+            answer = await agent.run(
+                query=query,
+                reply_string=reply_context
+            )
+            if use_cache:
+                await asyncio.to_thread(_store_cached_reply, group_id, query, answer)
         
         reply_msg = MessageSegment.reply(event.message_id) + answer
         await chat_at.finish(reply_msg)
         
     except FinishedException:
         raise
-    except Exception as e:
-        logger.error(f"聊天处理错误: {e}")
-        await chat_at.finish(f"抱歉，发生错误了：{str(e)} 😢 请稍后再试或联系管理员。")
+    except Exception:
+        logger.exception("聊天处理错误 group={} user={}", event.group_id, event.user_id)
+        await chat_at.finish(_ERR_MSG)
     
 
 # 仅允许群聊且为群主/管理员的命令
@@ -138,49 +285,71 @@ async def handle_chat_debug(bot: Bot, event: GroupMessageEvent):
         await chat_debug.finish(debug_info)
     except FinishedException:
         raise
-    except Exception as e:
-        logger.error(f"聊天调试错误: {e}")
-        await chat_debug.finish(f"抱歉，获取调试信息时发生错误：{str(e)} 😢 请稍后再试或联系管理员。")
+    except Exception:
+        logger.exception("聊天调试错误 group={}", event.group_id)
+        await chat_debug.finish(_DEBUG_ERR_MSG)
 
 # 定时任务：整理记忆
 try:
     require("nonebot_plugin_apscheduler")
     from nonebot_plugin_apscheduler import scheduler
 
+    # 同时整理的群组数上限，避免打满 LLM 服务
+    CONSOLIDATION_CONCURRENCY = 4
+    # 整理循环中每隔多少轮重新查询一次真实的未整理数量
+    CONSOLIDATION_RESYNC_EVERY = 10
+
+    async def _consolidate_group(group_id: str, manager, count: int, sem: asyncio.Semaphore):
+        """整理单个群组的记忆"""
+        async with sem:
+            try:
+                logger.info(f"[Chat] 群组 {group_id} 有 {count} 条未整理记忆，触发整理流程。")
+                
+                # 循环整理，直到未整理数量小于 50
+                iterations = 0
+                while count >= 50:
+                    # 每次处理 50 条
+                    # 注意：consolidate_memories 内部会自动创建 LLMClient 如果未提供
+                    processed = await manager.consolidate_memories(limit=50)
+                    
+                    # 死循环保护：如果本轮没有整理任何记忆（说明整理可能失败或无有效内容），强制跳出
+                    if not processed:
+                        logger.warning(f"[Chat] 群组 {group_id} 本轮未整理任何记忆（剩余约 {count} 条）。为防止死循环，中止整理。")
+                        break
+                    
+                    # 按处理数量推算剩余数量，每 CONSOLIDATION_RESYNC_EVERY 轮查库校准一次
+                    count -= processed
+                    iterations += 1
+                    if iterations % CONSOLIDATION_RESYNC_EVERY == 0:
+                        count = manager.get_unconsolidated_count()
+                    logger.debug(f"[Chat] 群组 {group_id} 剩余未整理记忆: {count}")
+                    
+                logger.info(f"[Chat] 群组 {group_id} 整理完成。最终数量: {count}")
+            except Exception as e:
+                logger.error(f"[Chat] 群组 {group_id} 记忆整理过程中出错: {e}")
+
     @scheduler.scheduled_job("interval", hours=1, id="chat_memory_consolidation")
     async def run_memory_consolidation():
         logger.info("[Chat] 开始执行定时记忆整理任务...")
-        # 遍历所有已加载的群组 Agent
+        # 先筛出未整理数量超过 100 的群组，只有这些群组才需要进入并发整理
+        pending = []
         for group_id, agent in list(group_agents.items()):
             try:
                 manager = agent.memory_manager
-                # 获取未整理的记忆数量
                 count = manager.get_unconsolidated_count()
-                
-                # 如果未整理数量超过 100，触发整理流程
                 if count > 100:
-                    logger.info(f"[Chat] 群组 {group_id} 有 {count} 条未整理记忆，触发整理流程。")
-                    
-                    # 循环整理，直到未整理数量小于 50
-                    while count >= 50:
-                        # 每次处理 50 条
-                        # 注意：consolidate_memories 内部会自动创建 LLMClient 如果未提供
-                        await manager.consolidate_memories(limit=50)
-                        
-                        # 重新获取数量以检查进度
-                        new_count = manager.get_unconsolidated_count()
-                        logger.debug(f"[Chat] 群组 {group_id} 剩余未整理记忆: {new_count}")
-                        
-                        # 死循环保护：如果数量没有减少（说明整理可能失败或无有效内容），强制跳出
-                        if new_count >= count:
-                            logger.warning(f"[Chat] 群组 {group_id} 记忆数量未减少 ({count} -> {new_count})。为防止死循环，中止整理。")
-                            break
-                        
-                        count = new_count
-                        
-                    logger.info(f"[Chat] 群组 {group_id} 整理完成。最终数量: {count}")
+                    pending.append((group_id, manager, count))
             except Exception as e:
-                logger.error(f"[Chat] 群组 {group_id} 记忆整理过程中出错: {e}")
+                logger.error(f"[Chat] 群组 {group_id} 获取未整理记忆数量失败: {e}")
+
+        if not pending:
+            return
+
+        sem = asyncio.Semaphore(CONSOLIDATION_CONCURRENCY)
+        await asyncio.gather(
+            *(_consolidate_group(group_id, manager, count, sem) for group_id, manager, count in pending),
+            return_exceptions=True,
+        )
 
 except Exception as e:
     logger.warning(f"加载 apscheduler 失败，定时任务将不会运行: {e}")
\ No newline at end of file
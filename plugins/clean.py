@@ -5,6 +5,8 @@ from nonebot.exception import FinishedException
 from nonebot.log import logger
 from utils.rules import allow_group_rule
 from datetime import datetime
+import time
+import numpy as np
 
 __plugin_meta__ = PluginMetadata(
     name="提纯",
@@ -13,6 +15,8 @@ __plugin_meta__ = PluginMetadata(
     supported_adapters={"~onebot.v11", "~onebot.v12"},
 )
 
+INACTIVE_DAYS = 61  # 超过60天未发言
+
 inactive_members = []  # 暗杀名单
 expired_time = 0
 
@@ -35,21 +39,17 @@ async def handle_clean_command(bot: Bot, event: GroupMessageEvent):
     try:
         members = await bot.get_group_member_list(group_id=group_id)
         logger.debug(members)
-        for member in members:
-            # 检查成员的最后发言时间
-            last_speak_time = member.get("last_sent_time", 0)
-            if last_speak_time:
-                # 将时间戳转换为 datetime 对象
-                last_speak_dt = datetime.fromtimestamp(last_speak_time)
-                # 计算当前时间与最后发言时间的差值
-                time_diff = datetime.now() - last_speak_dt
-                logger.debug(f"成员 {member['user_id']} 最后发言 {last_speak_dt}, 距今 {time_diff} 天")
-                # 超过60天未发言
-                if time_diff.days > 60:
-                    # 等级小于2级且未改名
-                    if int(member.get("level", 0)) <= 2 and member.get('card', '') == '':
-                        logger.debug(f"成员 {member['user_id']} 等级 {member.get('level', 0)}，未改名，加入暗杀名单")
-                        inactive_members.append({'id': member['user_id'], 'name': member.get('card', '') or member.get('nickname', '')})
+        # 向量化筛选：一次比较出超过60天未发言（距今满61天）且等级不超过2级的成员
+        last_sent = np.fromiter((int(m.get("last_sent_time", 0) or 0) for m in members), dtype=np.int64, count=len(members))
+        levels = np.fromiter((int(m.get("level", 0) or 0) for m in members), dtype=np.int64, count=len(members))
+        cutoff = int(time.time()) - INACTIVE_DAYS * 86400
+        mask = (last_sent > 0) & (last_sent <= cutoff) & (levels <= 2)
+        for idx in np.nonzero(mask)[0]:
+            member = members[idx]
+            # 未改名
+            if member.get('card', '') == '':
+                logger.debug(f"成员 {member['user_id']} 等级 {member.get('level', 0)}，未改名，加入暗杀名单")
+                inactive_members.append({'id': member['user_id'], 'name': member.get('card', '') or member.get('nickname', '')})
         inactive_members_list = '\n'.join(map(lambda x: f"{x['id']}({x['name']})", inactive_members))
         expired_time = datetime.now()
         if len(inactive_members) == 0:
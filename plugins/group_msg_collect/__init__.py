@@ -7,72 +7,121 @@ __plugin_meta__ = PluginMetadata(
     supported_adapters={"~onebot.v11"},
 )
 
-from .model import MessageRecord
+from .model import MessageRecord, format_message
 from .query import MessageRecorderAPI
 
-__all__ = ["MessageRecorderAPI", "MessageRecord"]
+__all__ = ["MessageRecorderAPI", "MessageRecord", "format_message"]
 
 from nonebot import on_message, get_driver, logger
 from nonebot.adapters.onebot.v11 import Bot, GroupMessageEvent, MessageSegment
 from nonebot.typing import T_State
 
-from .model import MessageRecord, init_database, engine, SessionLocal, sessionmaker
+from .model import MessageRecord, init_database, engine, SessionLocal, sessionmaker, dumps_json
+from sqlalchemy import insert
+from utils.rules import allowed_groups
+from sqlalchemy.exc import IntegrityError
 
 import asyncio
-import json
-from typing import List
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import count
+from typing import Any, Dict, List, Optional, Tuple
 from datetime import datetime
 
 # 驱动器事件
 driver = get_driver()
 
+# 待写入消息队列：消息处理器只负责入队，由后台任务攒批写库
+MESSAGE_QUEUE_MAXSIZE = 10000
+FLUSH_BATCH_SIZE = 200
+FLUSH_INTERVAL_SECONDS = 0.05
+
+message_queue: asyncio.Queue = asyncio.Queue(maxsize=MESSAGE_QUEUE_MAXSIZE)
+_flush_task: Optional[asyncio.Task] = None
+# 专用的单写线程：所有写库都串行在这一个线程上，不占用默认线程池，也不会与自身争抢 SQLite 写锁
+_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="message-writer")
+
 @driver.on_startup
 async def startup():
     """启动时初始化"""
+    global _flush_task
+    _flush_task = asyncio.create_task(flush_loop())
     logger.info("消息记录器已启动")
 
 @driver.on_shutdown
 async def shutdown():
-    """关闭时清理"""
+    """关闭时清理：停止后台任务并写入队列中剩余的消息"""
+    if _flush_task is not None:
+        # 等待后台任务退出：它会先写完已取出的批次和正在写入的批次
+        _flush_task.cancel()
+        try:
+            await _flush_task
+        except asyncio.CancelledError:
+            pass
+
+    remaining = []
+    while not message_queue.empty():
+        remaining.append(message_queue.get_nowait())
+    if remaining:
+        await _flush_batch(remaining)
+    # 等待写线程结束会阻塞，放到线程中执行
+    await asyncio.to_thread(_writer.shutdown, wait=True)
+
     logger.info("消息记录器已关闭")
 
+# 仅记录 allowed_groups 中的群（MESSAGE_RECORD_ALLOWED_ONLY=true 时生效），其余群不做任何提取和序列化
+RECORD_ALLOWED_ONLY = os.getenv("MESSAGE_RECORD_ALLOWED_ONLY", "false").lower() == "true"
+
+def _parse_group_ids(group_ids) -> frozenset:
+    """将允许列表中的群号转为整数，跳过无法解析的条目"""
+    parsed = set()
+    for group_id in group_ids:
+        if group_id.isdigit():
+            parsed.add(int(group_id))
+        else:
+            logger.warning(f"允许列表中的群号无效，已忽略: {group_id!r}")
+    return frozenset(parsed)
+
+# 只在开启记录过滤时才解析群号，未开启的部署不受允许列表内容影响
+_record_group_ids = _parse_group_ids(allowed_groups) if RECORD_ALLOWED_ONLY else frozenset()
+
+# 消息主类型优先级：image > voice > video > file，其余视为 text
+_TYPE_PRIORITY = {"image": 4, "voice": 3, "video": 2, "file": 1}
+
 def extract_message_info(event: GroupMessageEvent, bot: Bot) -> dict:
     """提取消息信息"""
-    # 获取消息类型
-    message_types = []
-    for segment in event.message:
-        message_types.append(segment.type)
-    
+    # 单次遍历消息段，同时得到主类型、纯文本和消息链
     primary_type = "text"
-    if "image" in message_types:
-        primary_type = "image"
-    elif "voice" in message_types:
-        primary_type = "voice"
-    elif "video" in message_types:
-        primary_type = "video"
-    elif "file" in message_types:
-        primary_type = "file"
+    best = 0
+    text_parts = []
+    chain = []
+    for segment in event.message:
+        seg_type = segment.type
+        if seg_type == "text":
+            text_parts.append(segment.data.get("text", ""))
+        else:
+            priority = _TYPE_PRIORITY.get(seg_type, 0)
+            if priority > best:
+                best = priority
+                primary_type = seg_type
+        chain.append({"type": seg_type, "data": segment.data})
+    plain_text = "".join(text_parts).strip()
     
-    # 提取回复信息
+    # 提取回复信息（OneBot v11 适配器会把 reply 段从 message 中剥离到 event.reply）
     reply_to = None
     if event.reply:
         reply_to = str(event.reply.message_id) if event.reply.message_id else None
     
-    # 获取纯文本
-    plain_text = event.get_plaintext().strip()
-    
-    # 修复消息链序列化
-    try:
-        message_chain_data = []
-        for seg in event.message:
-            message_chain_data.append({
-                "type": seg.type,
-                "data": seg.data
-            })
-        message_chain_json = json.dumps(message_chain_data)
-    except Exception as e:
-        logger.warning(f"消息链序列化失败: {e}")
-        message_chain_json = json.dumps([])
+    # 只有一个文本段的消息（最常见的情况）不存消息链，读取时由 plain_text 还原
+    if len(chain) == 1 and primary_type == "text" and chain[0]["type"] == "text":
+        message_chain_json = None
+    else:
+        try:
+            message_chain_json = dumps_json(chain)
+        except Exception as e:
+            logger.warning(f"消息链序列化失败: {e}")
+            message_chain_json = "[]"
     
     return {
         "message_id": str(event.message_id),
@@ -100,30 +149,93 @@ def on_message_save(callback: callable):
     _record_callbacks.append(callback)
     return callback
 
-async def save_message_to_db(msg_info: dict):
-    """直接保存单条消息到数据库"""
-    session = SessionLocal()
+def _insert_messages(rows: List[dict]):
+    """使用 Core insert 直接写入字典行（在写线程中执行）
+
+    写入路径不需要 ORM 的 Unit of Work，直接从连接池取连接执行，省去每批构造 Session 的开销；
+    engine.begin() 在退出时提交，异常时回滚。
+    """
+    with engine.begin() as conn:
+        conn.execute(insert(MessageRecord.__table__), rows)
+
+def _insert_messages_tolerant(rows: List[dict]) -> List[dict]:
+    """批量写入；整批失败（如某条 message_id 重复）时逐条重试，返回写入成功的行"""
     try:
-        record = MessageRecord(**msg_info)
-        session.add(record)
-        session.commit()
-        logger.debug(f"消息已保存到数据库: {msg_info['message_id']}")
-    
-    except Exception as e:
-        session.rollback()
-        logger.error(f"保存消息失败: {e}")
-    finally:
-        for cb in _record_callbacks:
+        _insert_messages(rows)
+        return rows
+    except IntegrityError:
+        saved = []
+        for row in rows:
             try:
-                if asyncio.iscoroutinefunction(cb):
-                    await cb(record.to_dict(), str(record))
-                else:
-                    cb(record.to_dict(), str(record))
-            except Exception as e:
-                logger.warning(f"Message callback failed: {e}")
-        session.close()
-    
-    return record
+                _insert_messages([row])
+                saved.append(row)
+            except IntegrityError:
+                logger.debug(f"消息已存在，跳过: {row['message_id']}")
+        return saved
+
+async def _flush_batch(batch: List[dict]):
+    """写入一批消息，并只对写入成功的消息通知订阅者"""
+    try:
+        saved = await asyncio.get_running_loop().run_in_executor(_writer, _insert_messages_tolerant, batch)
+        logger.debug(f"批量保存 {len(saved)}/{len(batch)} 条消息到数据库")
+    except Exception as e:
+        logger.error(f"批量保存消息失败 ({len(batch)} 条): {e}")
+        return
+
+    for msg_info in saved:
+        # 仅用于回调的临时对象，不加入 session
+        record = MessageRecord(**msg_info)
+        await _dispatch_callbacks(record.to_dict(), str(record))
+
+async def flush_loop():
+    """后台消费消息队列：攒够 FLUSH_BATCH_SIZE 条或等待 FLUSH_INTERVAL_SECONDS 后批量写库"""
+    loop = asyncio.get_running_loop()
+    batch = []
+    write = None
+    try:
+        while True:
+            batch = [await message_queue.get()]
+            deadline = loop.time() + FLUSH_INTERVAL_SECONDS
+
+            while len(batch) < FLUSH_BATCH_SIZE:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(message_queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            # shield：任务被取消时写入（及其回调）仍继续进行，由下方等待其完成
+            write = asyncio.ensure_future(_flush_batch(batch))
+            batch = []
+            await asyncio.shield(write)
+            write = None
+    except asyncio.CancelledError:
+        # 关闭时已从队列取出但尚未写入的消息不能丢
+        if write is not None:
+            await write
+        if batch:
+            await _flush_batch(batch)
+        raise
+
+def enqueue_message(msg_info: dict):
+    """消息入队等待批量写入；队列满时丢弃最旧的一条，保证新消息不丢"""
+    if message_queue.full():
+        dropped = message_queue.get_nowait()
+        logger.warning(f"消息写入队列已满，丢弃最旧消息: {dropped['message_id']}")
+    message_queue.put_nowait(msg_info)
+
+async def _dispatch_callbacks(message: dict, message_str: str):
+    """依次调用已注册的消息保存回调，单个回调失败不影响其他回调"""
+    for cb in _record_callbacks:
+        try:
+            if asyncio.iscoroutinefunction(cb):
+                await cb(message, message_str)
+            else:
+                cb(message, message_str)
+        except Exception as e:
+            logger.warning(f"Message callback failed: {e}")
 
 # 消息记录器
 message_recorder = on_message(priority=1, block=False)
@@ -131,23 +243,39 @@ message_recorder = on_message(priority=1, block=False)
 @message_recorder.handle()
 async def record_message(bot: Bot, event: GroupMessageEvent, state: T_State):
     """记录群消息"""
+    # 机器人自己发出的消息已由 record_sent_message 记录，回显事件直接跳过
+    if event.user_id == int(bot.self_id):
+        return
+    if RECORD_ALLOWED_ONLY and event.group_id not in _record_group_ids:
+        return
     try:
         msg_info = extract_message_info(event, bot)
-        await save_message_to_db(msg_info)
+        enqueue_message(msg_info)
             
     except Exception as e:
         logger.error(f"记录消息失败: {e}")
 
+# 机器人消息的兜底ID序号，同一纳秒内的多条消息也不会重复
+_bot_seq = count()
+
 # 记录机器人发言
-async def record_bot_message(bot: Bot, group_id: int, message: List, message_id: str = None, reply_to_message_id: str = None):
-    """记录机器人发言"""
+async def record_bot_message(
+    bot: Bot,
+    group_id: int,
+    raw_message: str,
+    plain_text: str,
+    message_chain: str,
+    message_id: str = None,
+    reply_to_message_id: str = None,
+):
+    """记录机器人发言（纯文本与消息链由调用方预先算好）"""
     try:
-        if SessionLocal is None:
-            return
+        # 只取一次当前时间，同时用于生成消息ID和记录时间
+        now_ns = time.time_ns()
 
         # 构造机器人消息记录
         bot_msg_info = {
-            "message_id": message_id or f"bot_{int(datetime.now().timestamp() * 1000)}",
+            "message_id": message_id or f"bot_{now_ns}_{next(_bot_seq)}",
             "bot_id": str(bot.self_id),
             "platform": "onebot-v11",
             "group_id": group_id,
@@ -155,69 +283,58 @@ async def record_bot_message(bot: Bot, group_id: int, message: List, message_id:
             "user_name": "BOT",
             "user_card": "机器人",
             "message_type": "text",
-            "raw_message": str(message),
-            "plain_text": gen_message(message),
-            "message_chain": json.dumps([seg.__dict__ for seg in message]),
-            "created_at": datetime.now(),
+            "raw_message": raw_message,
+            "plain_text": plain_text,
+            "message_chain": message_chain,
+            "created_at": datetime.fromtimestamp(now_ns / 1e9),
             "reply_to_message_id": reply_to_message_id ,
         }
         
-        await save_message_to_db(bot_msg_info)
+        enqueue_message(bot_msg_info)
             
     except Exception as e:
         logger.error(f"记录机器人消息失败: {e}")
 
-# Hook 机器人 call_api 方法
-original_call_api = None
+# 通过 NoneBot 的 on_called_api 钩子记录机器人发出的群消息，只在 API 调用完成后触发
+@Bot.on_called_api
+async def record_sent_message(bot: Bot, exception: Optional[Exception], api: str, data: Dict[str, Any], result: Any):
+    """记录机器人通过 send_msg 发出的群消息"""
+    if api != "send_msg" or exception is not None or not isinstance(bot, Bot):
+        return
 
-async def hooked_call_api(self, api: str, **data):
-    """Hook call_api 方法"""
-    global original_call_api
-    
-    # 调用原始方法
-    result = await original_call_api(self, api, **data)
-    
     try:
-        # 检查是否是发送群消息的API
-        if api == "send_msg":
-            group_id = data.get("group_id")
-            message = data.get("message", "")
-            message_id = result.get("message_id") if isinstance(result, dict) else None
-            
-            reply_to_message_id = None
-            for segment in message:
-                if segment.type == 'reply':
-                    # 如果是回复消息，获取回复的消息ID
-                    reply_to_message_id = segment.data.get('id')
-
-            if group_id:
-                await record_bot_message(self, group_id, message, str(message_id) if message_id else None, reply_to_message_id)
-                
-    except Exception as e:
-        logger.error(f"Hook记录机器人消息失败: {e}")
-    
-    return result
+        group_id = data.get("group_id")
+        if not group_id:
+            return
+
+        message = data.get("message", "")
+        message_id = result.get("message_id") if isinstance(result, dict) else None
+
+        reply_to_message_id, plain_text, message_chain = _summarize_chain(message)
+
+        await record_bot_message(
+            bot,
+            group_id,
+            str(message),
+            plain_text,
+            message_chain,
+            str(message_id) if message_id else None,
+            reply_to_message_id,
+        )
 
-@driver.on_startup
-async def hook_bot_methods():
-    """在启动时Hook机器人方法"""
-    global original_call_api
-    
-    # 等待一下确保Bot实例存在
-    await asyncio.sleep(1)
-    
-    try:
-        # Hook Bot 的 call_api 方法
-        from nonebot.adapters.onebot.v11 import Bot as OneBotV11Bot
-        
-        if original_call_api is None:
-            original_call_api = OneBotV11Bot.call_api
-            OneBotV11Bot.call_api = hooked_call_api
-            logger.info("已Hook机器人call_api方法")
     except Exception as e:
-        logger.error(f"Hook机器人方法失败: {e}")
+        logger.error(f"记录机器人发送消息失败: {e}")
 
-def gen_message(message_chain: List[MessageSegment]) -> str:
-    """生成纯文本内容"""
-    return "".join(str(seg) for seg in message_chain if seg.type == 'text').strip()
-            
\ No newline at end of file
+def _summarize_chain(message_chain: List[MessageSegment]) -> Tuple[Optional[str], str, str]:
+    """单次遍历消息段，同时得到被回复的消息ID、纯文本和序列化后的消息链"""
+    reply_to = None
+    text_parts = []
+    chain = []
+    for seg in message_chain:
+        seg_type = seg.type
+        if seg_type == 'text':
+            text_parts.append(seg.data.get('text', ''))
+        elif seg_type == 'reply' and reply_to is None:
+            reply_to = seg.data.get('id')
+        chain.append({"type": seg_type, "data": seg.data})
+    return reply_to, "".join(text_parts).strip(), dumps_json(chain)
@@ -1,12 +1,28 @@
 import os
 import json
 
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, Boolean, Index, desc, and_, or_, BigInteger
+from sqlalchemy import create_engine, event, Column, Integer, String, Text, DateTime, Boolean, Index, desc, and_, or_, BigInteger
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from datetime import datetime, timedelta
 from pathlib import Path
 from typing import List, Optional, Dict, Any
+from loguru import logger
+
+try:
+    import orjson
+
+    def dumps_json(obj) -> str:
+        return orjson.dumps(obj).decode()
+
+    loads_json = orjson.loads
+    JSONDecodeError = orjson.JSONDecodeError
+except ImportError:
+    def dumps_json(obj) -> str:
+        return json.dumps(obj, ensure_ascii=False)
+
+    loads_json = json.loads
+    JSONDecodeError = json.JSONDecodeError
 
 # 数据库配置
 DATABASE_URL = os.getenv("MESSAGE_DB_URL", "sqlite:///data/messages.db")
@@ -33,7 +49,7 @@ class MessageRecord(Base):
     message_type = Column(String(16), nullable=False)
     raw_message = Column(Text)
     plain_text = Column(Text)
-    message_chain = Column(Text)  # JSON字符串
+    message_chain = Column(Text)  # JSON字符串；只含一个文本段的消息为 NULL
     
     # 时间信息
     created_at = Column(DateTime, nullable=False, index=True)
@@ -49,30 +65,12 @@ class MessageRecord(Base):
         Index('idx_group_time', 'group_id', 'created_at'),
         Index('idx_user_time', 'user_id', 'created_at'),
         Index('idx_group_user', 'group_id', 'user_id'),
-        Index('idx_plain_text', 'plain_text'),  # 用于文本搜索
+        Index('idx_group_type_time', 'group_id', 'message_type', 'created_at'),
     )
     
     def to_dict(self) -> Dict[str, Any]:
         """转换为字典"""
-        return {
-            'id': self.id,
-            'message_id': self.message_id,
-            'bot_id': self.bot_id,
-            'platform': self.platform,
-            'group_id': self.group_id,
-            'user_id': self.user_id,
-            'user_name': self.user_name,
-            'user_card': self.user_card,
-            'message_type': self.message_type,
-            'raw_message': self.raw_message,
-            'plain_text': self.plain_text,
-            'message_chain': json.loads(self.message_chain) if self.message_chain else None,
-            'created_at': self.created_at.isoformat() if self.created_at else None,
-            'recorded_at': self.recorded_at.isoformat() if self.recorded_at else None,
-            'reply_to_message_id': self.reply_to_message_id,
-            'is_deleted': self.is_deleted,
-            'is_recalled': self.is_recalled,
-        }
+        return row_to_dict({name: getattr(self, name) for name in _COLUMN_NAMES})
     
     def __str__(self):
         """字符串表示"""
@@ -82,24 +80,139 @@ class MessageRecord(Base):
         """获取图片ID"""
         if self.message_type == "image":
             try:
-                message_chain = json.loads(self.message_chain)
+                message_chain = loads_json(self.message_chain)
                 for segment in message_chain:
                     if segment['type'] == 'image':
                         return segment['data'].get('file', None)
-            except json.JSONDecodeError:
+            except JSONDecodeError:
                 return None
         else:
             raise ValueError("当前消息类型不是图片")
     
+_COLUMN_NAMES = tuple(column.name for column in MessageRecord.__table__.columns)
+
+def _text_chain(plain_text: Optional[str]) -> Optional[List[Dict[str, Any]]]:
+    """纯文本消息不存储消息链，按 plain_text 还原为单个文本段"""
+    if plain_text is None:
+        return None
+    return [{"type": "text", "data": {"text": plain_text}}]
+
+def row_to_dict(row) -> Dict[str, Any]:
+    """将一行消息记录（ORM 属性或 Core 查询结果映射）转换为字典"""
+    message_chain = row['message_chain']
+    created_at = row['created_at']
+    recorded_at = row['recorded_at']
+    return {
+        'id': row['id'],
+        'message_id': row['message_id'],
+        'bot_id': row['bot_id'],
+        'platform': row['platform'],
+        'group_id': row['group_id'],
+        'user_id': row['user_id'],
+        'user_name': row['user_name'],
+        'user_card': row['user_card'],
+        'message_type': row['message_type'],
+        'raw_message': row['raw_message'],
+        'plain_text': row['plain_text'],
+        'message_chain': loads_json(message_chain) if message_chain else _text_chain(row['plain_text']),
+        'created_at': created_at.isoformat() if created_at else None,
+        'recorded_at': recorded_at.isoformat() if recorded_at else None,
+        'reply_to_message_id': row['reply_to_message_id'],
+        'is_deleted': row['is_deleted'],
+        'is_recalled': row['is_recalled'],
+    }
+
+def format_message(message: Dict[str, Any]) -> str:
+    """消息字典的字符串表示，与 MessageRecord.__str__ 格式一致"""
+    created_at = message['created_at']
+    if created_at:
+        created_at = created_at.replace('T', ' ')
+    return f"[{message['message_id']}] [{created_at}] {message['user_card'] or message['user_name']} ({message['user_id']}): {message['raw_message']}"
+
 # 数据库初始化
 def init_database():
     """初始化数据库"""
     db_path = Path(DATABASE_URL.replace("sqlite:///", ""))
     db_path.parent.mkdir(parents=True, exist_ok=True)
     
-    engine = create_engine(DATABASE_URL, echo=False)
+    if DATABASE_URL.startswith("sqlite") and ":memory:" not in DATABASE_URL:
+        # 写入在线程池中执行，需允许跨线程使用连接；连接池上限 5，避免大量线程同时争抢写锁
+        engine = create_engine(
+            DATABASE_URL,
+            echo=False,
+            connect_args={"check_same_thread": False},
+            pool_size=5,
+            max_overflow=0,
+        )
+
+        @event.listens_for(engine, "connect")
+        def _set_sqlite_pragma(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            # WAL 模式下读写互不阻塞，synchronous=NORMAL 在 WAL 下仍保证一致性
+            cursor.execute("PRAGMA journal_mode=WAL")
+            cursor.execute("PRAGMA synchronous=NORMAL")
+            # 每 1000 页自动 checkpoint，避免 WAL 文件无限增长
+            cursor.execute("PRAGMA wal_autocheckpoint=1000")
+            # 临时表放内存，页缓存约 20MB，mmap 256MB
+            cursor.execute("PRAGMA temp_store=MEMORY")
+            cursor.execute("PRAGMA cache_size=-20000")
+            cursor.execute("PRAGMA mmap_size=268435456")
+            # 遇到写锁时最多等待 5 秒，而不是立即报 database is locked
+            cursor.execute("PRAGMA busy_timeout=5000")
+            cursor.close()
+    else:
+        engine = create_engine(DATABASE_URL, echo=False)
+
     Base.metadata.create_all(engine)
+    # create_all 不会给已存在的表补建新索引，这里逐个检查补齐
+    for index in MessageRecord.__table__.indexes:
+        index.create(bind=engine, checkfirst=True)
+
+    if engine.dialect.name == "sqlite":
+        _init_fts(engine)
     return engine
 
+# 全文检索（SQLite FTS5）：message_fts 以 message_records 为外部内容表，由触发器保持同步
+# 使用 trigram 分词器，中文任意子串都可检索（unicode61 会把连续汉字当作一个词）
+FTS_MIN_KEYWORD_LENGTH = 3  # trigram 至少需要 3 个字符，更短的关键词回退到 LIKE
+FTS_ENABLED = False
+
+_FTS_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS message_fts USING fts5(
+        plain_text, content='message_records', content_rowid='id', tokenize='trigram'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS message_fts_ai AFTER INSERT ON message_records BEGIN
+        INSERT INTO message_fts(rowid, plain_text) VALUES (new.id, new.plain_text);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS message_fts_ad AFTER DELETE ON message_records BEGIN
+        INSERT INTO message_fts(message_fts, rowid, plain_text) VALUES ('delete', old.id, old.plain_text);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS message_fts_au AFTER UPDATE OF plain_text ON message_records BEGIN
+        INSERT INTO message_fts(message_fts, rowid, plain_text) VALUES ('delete', old.id, old.plain_text);
+        INSERT INTO message_fts(rowid, plain_text) VALUES (new.id, new.plain_text);
+    END""",
+]
+
+def _init_fts(engine):
+    """创建 FTS5 全文索引及同步触发器；首次创建时从现有数据重建索引"""
+    global FTS_ENABLED
+    try:
+        with engine.begin() as conn:
+            exists = conn.exec_driver_sql(
+                "SELECT 1 FROM sqlite_master WHERE type='table' AND name='message_fts'"
+            ).first() is not None
+            for ddl in _FTS_DDL:
+                conn.exec_driver_sql(ddl)
+            if not exists:
+                conn.exec_driver_sql("INSERT INTO message_fts(message_fts) VALUES ('rebuild')")
+            # 旧版本的 plain_text B-tree 索引对 '%kw%' 查询无用，只会增加写放大
+            conn.exec_driver_sql("DROP INDEX IF EXISTS idx_plain_text")
+        FTS_ENABLED = True
+    except Exception as e:
+        # SQLite 未编译 FTS5 或版本过旧（trigram 需要 3.34+）时回退到 LIKE 查询
+        FTS_ENABLED = False
+        logger.warning(f"FTS5 全文索引不可用，关键词搜索回退到 LIKE: {e}")
+
 engine = init_database()
-SessionLocal = sessionmaker(bind=engine)
\ No newline at end of file
+# 提交后不过期对象属性，会话关闭后仍可直接读取查询结果；会话只用于查询，关闭自动 flush
+SessionLocal = sessionmaker(bind=engine, expire_on_commit=False, autoflush=False)
\ No newline at end of file
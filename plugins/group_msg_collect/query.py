@@ -1,11 +1,33 @@
-from .model import SessionLocal, MessageRecord
+from . import model
+from .model import SessionLocal, MessageRecord, row_to_dict
+from sqlalchemy import text, select, literal, func
+from cachetools import TTLCache
+from sqlalchemy.orm import aliased
 
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from datetime import datetime, timedelta
 from pathlib import Path
 from typing import List, Optional, Dict, Any
+import threading
 
+# 回复链向上追溯的最大深度，防止异常数据形成环时无限递归
+REPLY_CHAIN_MAX_DEPTH = 64
+
+# 消息计数缓存：相同查询条件 5 秒内复用结果
+_count_cache: TTLCache = TTLCache(maxsize=512, ttl=5)
+_count_cache_lock = threading.Lock()
+
+
+def _keyword_clause(keyword: str):
+    """关键词过滤条件：可用时走 FTS5 全文索引，否则回退到 LIKE"""
+    if model.FTS_ENABLED and len(keyword) >= model.FTS_MIN_KEYWORD_LENGTH:
+        # 作为短语整体匹配，双引号需转义
+        phrase = '"' + keyword.replace('"', '""') + '"'
+        return text(
+            "message_records.id IN (SELECT rowid FROM message_fts WHERE message_fts MATCH :fts_phrase)"
+        ).bindparams(fts_phrase=phrase)
+    return MessageRecord.plain_text.contains(keyword)
 
 
 class MessageRecorderAPI:
@@ -26,8 +48,9 @@ class MessageRecorderAPI:
         keyword: Optional[str] = None,
         limit: int = 100,
         offset: int = 0,
-        order_by: str = "desc"  # desc 或 asc
-    ) -> List[MessageRecord]:
+        order_by: str = "desc",  # desc 或 asc
+        require_text: bool = False
+    ) -> List[Dict[str, Any]]:
         """
         查询消息记录
         
@@ -41,62 +64,67 @@ class MessageRecorderAPI:
             limit: 返回数量限制
             offset: 偏移量
             order_by: 排序方式 (desc: 新到旧, asc: 旧到新)
+            require_text: 只返回纯文本内容非空（去除空白后）的消息
         
         Returns:
-            消息记录列表
+            消息记录字典列表（格式同 MessageRecord.to_dict）
         """
+        # 列表查询直接走 Core，跳过 ORM 对象实例化和 identity map
+        table = MessageRecord.__table__
+        stmt = select(table)
+        
+        # 添加过滤条件
+        if group_id:
+            stmt = stmt.where(table.c.group_id == group_id)
+        if user_id:
+            stmt = stmt.where(table.c.user_id == user_id)
+        if start_time:
+            stmt = stmt.where(table.c.created_at >= start_time)
+        if end_time:
+            stmt = stmt.where(table.c.created_at <= end_time)
+        if message_type:
+            stmt = stmt.where(table.c.message_type == message_type)
+        if keyword:
+            stmt = stmt.where(_keyword_clause(keyword))
+        if require_text:
+            # 只含空白的消息同样视为无文本，在 SQL 中一并排除，无需 Python 侧二次过滤
+            stmt = stmt.where(func.trim(table.c.plain_text, ' \t\r\n') != '')
+        
+        # 排序
+        if order_by == "asc":
+            stmt = stmt.order_by(table.c.created_at.asc())
+        else:
+            stmt = stmt.order_by(table.c.created_at.desc())
+        
+        # 分页
+        stmt = stmt.offset(offset).limit(limit)
+        
         session = MessageRecorderAPI.get_session()
         try:
-            query = session.query(MessageRecord)
-            
-            # 添加过滤条件
-            if group_id:
-                query = query.filter(MessageRecord.group_id == group_id)
-            if user_id:
-                query = query.filter(MessageRecord.user_id == user_id)
-            if start_time:
-                query = query.filter(MessageRecord.created_at >= start_time)
-            if end_time:
-                query = query.filter(MessageRecord.created_at <= end_time)
-            if message_type:
-                query = query.filter(MessageRecord.message_type == message_type)
-            if keyword:
-                query = query.filter(MessageRecord.plain_text.contains(keyword))
-            
-            # 排序
-            if order_by == "asc":
-                query = query.order_by(MessageRecord.created_at.asc())
-            else:
-                query = query.order_by(MessageRecord.created_at.desc())
-            
-            # 分页
-            query = query.offset(offset).limit(limit)
-            
-            messages = query.all()
-            return messages
-            # return [msg.to_dict() for msg in messages]
-            
+            rows = session.execute(stmt).mappings().all()
         finally:
             session.close()
+        return [row_to_dict(row) for row in rows]
     
     @staticmethod
-    def get_message_by_id(message_id: str) -> Optional[MessageRecord]:
+    def get_message_by_id(message_id: str) -> Optional[Dict[str, Any]]:
         """根据消息ID获取消息"""
+        table = MessageRecord.__table__
         session = MessageRecorderAPI.get_session()
         try:
-            message = session.query(MessageRecord).filter(
-                MessageRecord.message_id == message_id
-            ).first()
-            return message if message else None
+            row = session.execute(
+                select(table).where(table.c.message_id == message_id)
+            ).mappings().first()
         finally:
             session.close()
+        return row_to_dict(row) if row else None
     
     @staticmethod
     def get_recent_messages(
         group_id: int, 
         minutes: int = 10, 
         limit: int = 100
-    ) -> List[MessageRecord]:
+    ) -> List[Dict[str, Any]]:
         """获取最近N分钟的消息"""
         start_time = datetime.now() - timedelta(minutes=minutes)
         return MessageRecorderAPI.get_messages(
@@ -112,7 +140,7 @@ class MessageRecorderAPI:
         group_id: Optional[int] = None,
         days: int = 30,
         limit: int = 50
-    ) -> List[MessageRecord]:
+    ) -> List[Dict[str, Any]]:
         """搜索包含关键词的消息"""
         start_time = datetime.now() - timedelta(days=days)
         return MessageRecorderAPI.get_messages(
@@ -128,7 +156,7 @@ class MessageRecorderAPI:
         group_id: Optional[int] = None,
         days: int = 7,
         limit: int = 100
-    ) -> List[MessageRecord]:
+    ) -> List[Dict[str, Any]]:
         """获取用户的消息记录"""
         start_time = datetime.now() - timedelta(days=days)
         return MessageRecorderAPI.get_messages(
@@ -138,25 +166,48 @@ class MessageRecorderAPI:
             limit=limit
         )
     
+    @staticmethod
+    def _ancestors_stmt(message_id: str):
+        """向上追溯回复链的查询：递归 CTE 一次查出自身及全部祖先，按深度倒序即从最早的消息开始"""
+        ancestor = aliased(MessageRecord)
+        chain_cte = select(
+            MessageRecord.message_id,
+            MessageRecord.reply_to_message_id,
+            literal(0).label("depth"),
+        ).where(
+            MessageRecord.message_id == message_id
+        ).cte("chain", recursive=True)
+        chain_cte = chain_cte.union_all(
+            select(
+                ancestor.message_id,
+                ancestor.reply_to_message_id,
+                chain_cte.c.depth + 1,
+            ).join(
+                chain_cte, ancestor.message_id == chain_cte.c.reply_to_message_id
+            ).where(chain_cte.c.depth < REPLY_CHAIN_MAX_DEPTH)
+        )
+        return (
+            select(MessageRecord)
+            .join(chain_cte, MessageRecord.message_id == chain_cte.c.message_id)
+            .order_by(chain_cte.c.depth.desc())
+        )
+    
+    @staticmethod
+    def get_reply_ancestors(message_id: str) -> List[MessageRecord]:
+        """获取消息自身及其向上的全部祖先（从最早的消息开始），不包含任何回复它的消息"""
+        session = MessageRecorderAPI.get_session()
+        try:
+            return list(session.scalars(MessageRecorderAPI._ancestors_stmt(message_id)))
+        finally:
+            session.close()
+    
     @staticmethod
     def get_reply_chain(message_id: str) -> List[MessageRecord]:
         """获取回复链"""
         session = MessageRecorderAPI.get_session()
         try:
-            chain = []
-            current_id = message_id
-            
             # 向上追溯回复链
-            while current_id:
-                message = session.query(MessageRecord).filter(
-                    MessageRecord.message_id == current_id
-                ).first()
-                
-                if not message:
-                    break
-                    
-                chain.insert(0, message)
-                current_id = message.reply_to_message_id
+            chain = list(session.scalars(MessageRecorderAPI._ancestors_stmt(message_id)))
             
             # 向下查找被回复的消息
             replies = session.query(MessageRecord).filter(
@@ -179,23 +230,33 @@ class MessageRecorderAPI:
         end_time: Optional[datetime] = None,
         message_type: Optional[str] = None
     ) -> int:
-        """统计消息数量"""
+        """统计消息数量（相同条件 5 秒内直接返回缓存结果）"""
+        cache_key = (group_id, user_id, start_time, end_time, message_type)
+        with _count_cache_lock:
+            cached = _count_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
+        where_clauses = []
+        if group_id:
+            where_clauses.append(MessageRecord.group_id == group_id)
+        if user_id:
+            where_clauses.append(MessageRecord.user_id == user_id)
+        if start_time:
+            where_clauses.append(MessageRecord.created_at >= start_time)
+        if end_time:
+            where_clauses.append(MessageRecord.created_at <= end_time)
+        if message_type:
+            where_clauses.append(MessageRecord.message_type == message_type)
+        
+        # 直接 SELECT count(*) ... WHERE，不像 query.count() 那样包一层子查询，可走索引计数
+        stmt = select(func.count()).select_from(MessageRecord).where(*where_clauses)
         session = MessageRecorderAPI.get_session()
         try:
-            query = session.query(MessageRecord)
-            
-            if group_id:
-                query = query.filter(MessageRecord.group_id == group_id)
-            if user_id:
-                query = query.filter(MessageRecord.user_id == user_id)
-            if start_time:
-                query = query.filter(MessageRecord.created_at >= start_time)
-            if end_time:
-                query = query.filter(MessageRecord.created_at <= end_time)
-            if message_type:
-                query = query.filter(MessageRecord.message_type == message_type)
-            
-            return query.count()
-            
+            total = session.execute(stmt).scalar_one()
         finally:
-            session.close()
\ No newline at end of file
+            session.close()
+        
+        with _count_cache_lock:
+            _count_cache[cache_key] = total
+        return total
@@ -1,4 +1,4 @@
-from nonebot import get_loaded_plugins, on_command
+from nonebot import get_driver, get_loaded_plugins, on_command
 from nonebot.adapters.onebot.v11 import Bot, MessageEvent, GroupMessageEvent
 from nonebot.plugin import PluginMetadata
 from nonebot.exception import FinishedException
@@ -19,6 +19,51 @@ FILTERED_PLUGINS = {
     "new_member",  # 新成员欢迎插件
 }
 
+# 插件集合在启动后不再变化，启动时预先构建帮助信息
+_HELP_PLUGINS: list = []       # 帮助列表中展示的插件（已排序）
+_HELP_PLUGIN_NAMES: list = []  # 未找到插件时的建议列表（按加载顺序）
+_DETAIL_PLUGINS: list = []     # 可查询详情的插件（按加载顺序）
+_HELP_BY_KEY: dict = {}        # 小写插件名/元数据名 -> 插件
+_HELP_TEXT: str = ""
+
+driver = get_driver()
+
+@driver.on_startup
+async def build_help_cache():
+    """构建帮助信息缓存"""
+    global _HELP_PLUGINS, _HELP_PLUGIN_NAMES, _DETAIL_PLUGINS, _HELP_BY_KEY, _HELP_TEXT
+
+    # 过滤系统插件和三方插件，只保留有元数据的插件
+    _DETAIL_PLUGINS = [
+        plugin for plugin in get_loaded_plugins()
+        if plugin.name not in FILTERED_PLUGINS and plugin.metadata
+    ]
+    listed = [plugin for plugin in _DETAIL_PLUGINS if not plugin.name.startswith("nonebot_plugin_")]
+    _HELP_PLUGIN_NAMES = [plugin.metadata.name for plugin in listed]
+
+    # 按插件名称排序
+    _HELP_PLUGINS = sorted(listed, key=lambda p: p.metadata.name)
+
+    # 精确匹配索引，按加载顺序保留先出现的插件
+    _HELP_BY_KEY = {}
+    for plugin in _DETAIL_PLUGINS:
+        _HELP_BY_KEY.setdefault(plugin.metadata.name.lower(), plugin)
+        _HELP_BY_KEY.setdefault(plugin.name.lower(), plugin)
+
+    help_lines = ["🤖 杭高院考研群机器人", '']
+    for plugin in _HELP_PLUGINS:
+        meta = plugin.metadata
+        help_lines.append(f"  📦 {meta.name}")
+        help_lines.append(f"  📖 {meta.description}")
+        help_lines.append('')
+    
+    help_lines.append("💡 使用方法:")
+    help_lines.append("   /help <插件名> - 查看具体用法")
+    help_lines.append("   例如: /help ping")
+    _HELP_TEXT = "\n".join(help_lines)
+
+    logger.debug(f"帮助信息已缓存，共 {len(_HELP_PLUGINS)} 个插件")
+
 help_cmd = on_command("help", rule=allow_group_rule, aliases={"帮助"}, priority=1, block=True)
 
 @help_cmd.handle()
@@ -43,68 +88,22 @@ async def handle_help(bot: Bot, event: MessageEvent):
 
 async def show_all_plugins(event: MessageEvent):
     """显示所有插件的帮助信息"""
-    help_lines = ["🤖 杭高院考研群机器人", '']
-    
-    # 获取过滤后的插件
-    filtered_plugins = []
-    for plugin in get_loaded_plugins():
-        # 过滤系统插件和三方插件
-        if plugin.name in FILTERED_PLUGINS:
-            continue
-        if plugin.name.startswith("nonebot_plugin_"):
-            continue
-            
-        # 只显示有元数据的插件
-        if plugin.metadata:
-            filtered_plugins.append(plugin)
-    
-    if not filtered_plugins:
+    if not _HELP_PLUGINS:
         await help_cmd.finish("❌ 暂无可用插件")
     
-    # 按插件名称排序
-    filtered_plugins.sort(key=lambda p: p.metadata.name)
-    
-    # 添加插件信息
-    for i, plugin in enumerate(filtered_plugins, 1):
-        logger.debug(f"插件 {i}: {plugin.name} - {plugin.metadata.name if plugin.metadata else '无元数据'}")
-        meta = plugin.metadata
-        help_lines.append(f"  📦 {meta.name}")
-        help_lines.append(f"  📖 {meta.description}")
-        help_lines.append('')
-    
-    # help_lines.append("")
-    help_lines.append("💡 使用方法:")
-    help_lines.append("   /help <插件名> - 查看具体用法")
-    help_lines.append("   例如: /help ping")
-    
-    await help_cmd.finish("\n".join(help_lines))
+    await help_cmd.finish(_HELP_TEXT)
 
 async def show_plugin_detail(event: MessageEvent, plugin_name: str):
     """显示特定插件的详细信息"""
-    # 查找插件（支持模糊匹配）
-    target_plugin = None
-    
-    for plugin in get_loaded_plugins():
-        if plugin.name in FILTERED_PLUGINS:
-            continue
-            
-        if not plugin.metadata:
-            continue
-            
-        meta = plugin.metadata
-        # 精确匹配或模糊匹配
-        if (plugin_name.lower() == meta.name.lower() or 
-            plugin_name.lower() in meta.name.lower() or
-            plugin_name.lower() == plugin.name.lower()):
-            target_plugin = plugin
-            break
+    # 查找插件：先按插件名/元数据名精确匹配，再按元数据名模糊匹配
+    key = plugin_name.lower()
+    target_plugin = _HELP_BY_KEY.get(key)
+    if target_plugin is None:
+        target_plugin = next((p for p in _DETAIL_PLUGINS if key in p.metadata.name.lower()), None)
     
     if not target_plugin:
         # 提供可用插件建议
-        available_plugins = []
-        for plugin in get_loaded_plugins():
-            if plugin.name not in FILTERED_PLUGINS and not plugin.name.startswith("nonebot_plugin_") and plugin.metadata:
-                available_plugins.append(plugin.metadata.name)
+        available_plugins = _HELP_PLUGIN_NAMES
         
         suggestion = ""
         if available_plugins:
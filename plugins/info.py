@@ -5,7 +5,20 @@ from nonebot.plugin import PluginMetadata
 from nonebot.exception import FinishedException
 from utils.rules import allow_group_rule
 from pathlib import Path
-import toml
+
+try:
+    # Python 3.11+ 标准库自带 C 实现的 TOML 解析器
+    import tomllib
+
+    def _load_toml(path: Path) -> dict:
+        with open(path, 'rb') as f:
+            return tomllib.load(f)
+except ImportError:
+    import toml
+
+    def _load_toml(path: Path) -> dict:
+        with open(path, 'r', encoding='utf-8') as f:
+            return toml.load(f)
 
 __plugin_meta__ = PluginMetadata(
     name="项目信息",
@@ -16,11 +29,15 @@ __plugin_meta__ = PluginMetadata(
 
 # 项目信息缓存
 project_info = None
+# 预先拼好的回复文本，None 表示尚未加载
+info_text = None
 
 def load_project_info():
     """加载 pyproject.toml 项目信息"""
-    global project_info
+    global project_info, info_text
     
+    # 读取失败也缓存提示文本，避免每次命令都重新查找解析文件
+    info_text = """⚠️ 无法读取项目配置文件"""
     try:
         # 查找 pyproject.toml 文件
         pyproject_path = Path("pyproject.toml")
@@ -31,8 +48,7 @@ def load_project_info():
                 return None
         
         # 读取 pyproject.toml 文件
-        with open(pyproject_path, 'r', encoding='utf-8') as f:
-            data = toml.load(f)
+        data = _load_toml(pyproject_path)
         
         # 提取项目信息
         project_section = data.get('project', {})
@@ -42,6 +58,9 @@ def load_project_info():
             'version': project_section.get('version', '未知版本'),
             'description': project_section.get('description', '无描述')
         }
+        info_text = f"""🤖 {project_info['name']}
+📦 版本: {project_info['version']}
+📖 描述: {project_info['description']}"""
         
         return project_info
         
@@ -62,18 +81,9 @@ info_cmd = on_command("info", rule=allow_group_rule, aliases={"版本", "信息"
 async def handle_info(bot: Bot, event: MessageEvent):
     """处理info命令"""
     try:
-        # 获取项目信息
-        if not project_info:
+        if info_text is None:
             load_project_info()
         
-        if project_info:
-            # 显示项目基本信息
-            info_text = f"""🤖 {project_info['name']}
-📦 版本: {project_info['version']}
-📖 描述: {project_info['description']}"""
-        else:
-            info_text = """⚠️ 无法读取项目配置文件"""
-        
         await info_cmd.finish(info_text)
     
     except FinishedException:
@@ -1,13 +1,16 @@
 import asyncio
 import os
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 from nonebot import on_command, get_driver
-from nonebot.adapters.onebot.v11 import Bot, GroupMessageEvent, MessageSegment, Message
+from nonebot.adapters.onebot.v11 import Bot, GroupMessageEvent, MessageSegment, Message, ActionFailed
 from nonebot.plugin import PluginMetadata
 from nonebot.exception import FinishedException
 from nonebot.log import logger
-from nonebot.utils import run_sync  # 导入 run_sync
 
 import jmcomic
 
@@ -23,19 +26,80 @@ __plugin_meta__ = PluginMetadata(
 )
 
 jm_cmd = on_command("jm", priority=5, block=True)
-option = jmcomic.create_option_by_file('./jm_option.yml')
+JM_OPTION_PATH = './jm_option.yml'
 
 ROOT_DIR = Path(os.getcwd()) / "data" / "jm" / "download"
 PUBLIC_SERVER_IP = os.getenv("PUBLIC_SERVER_IP", "0.0.0.0")
 
-# # (可选) 定义你想识别为图片的后缀名
-IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".gif", ".bmp"}
+# # (可选) 定义你想识别为图片的后缀名（不含点、小写）
+IMAGE_EXTENSIONS = frozenset({"jpg", "jpeg", "png", "gif", "bmp"})
+
+# 每个群同时最多进行 2 个下载任务，避免占满线程池
+MAX_CONCURRENT_DOWNLOADS = 2
+_download_semaphores = defaultdict(lambda: asyncio.Semaphore(MAX_CONCURRENT_DOWNLOADS))
+# 单本下载的最长等待时间（秒）
+DOWNLOAD_TIMEOUT = int(os.getenv("JM_DOWNLOAD_TIMEOUT", "600"))
+# 下载动辄数分钟，放在专用线程池中执行，不占用 NoneBot 默认线程池；
+# 本子内部的图片/章节并发由 jm_option.yml 的 download.threading 控制
+# JmOption 内部持有客户端等可变状态，每个下载线程各自从配置文件创建一份，线程间不共享
+_thread_local = threading.local()
+
+def _init_download_worker():
+    _thread_local.option = jmcomic.create_option_by_file(JM_OPTION_PATH)
+
+def _download_album(album_id: int):
+    """在下载线程中使用该线程自己的 option 下载本子"""
+    return _thread_local.option.download_album(album_id)
+
+JM_EXECUTOR = ThreadPoolExecutor(
+    max_workers=4,
+    thread_name_prefix="jm-dl",
+    initializer=_init_download_worker,
+)
+
+class _SendThrottler:
+    """滑动窗口限速器：任意 period 秒内最多放行 rate_limit 次调用"""
+
+    def __init__(self, rate_limit: int, period: float):
+        self.rate_limit = rate_limit
+        self.period = period
+        self._sent = deque()
+        self._lock = asyncio.Lock()
+
+    async def __aenter__(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                while self._sent and now - self._sent[0] >= self.period:
+                    self._sent.popleft()
+                if len(self._sent) < self.rate_limit:
+                    self._sent.append(now)
+                    return
+                await asyncio.sleep(self.period - (now - self._sent[0]))
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return False
+
+# 合并转发：不超过 SINGLE_FORWARD_MAX_NODES 页时整本一条发送，否则每 CHUNK_SIZE 页一条
+SINGLE_FORWARD_MAX_NODES = int(os.getenv("JM_SINGLE_FORWARD_MAX_NODES", "100"))
+CHUNK_SIZE = 20
+
+# 合并转发消息的发送限速：按群共享，多个 /jm 同时进行时也不会超过风控阈值
+SEND_RATE_LIMIT = 20
+SEND_RATE_PERIOD = 60
+_send_throttlers = defaultdict(lambda: _SendThrottler(SEND_RATE_LIMIT, SEND_RATE_PERIOD))
 
 driver = get_driver()
 
 @driver.on_startup
 async def start_file_server():
     """NoneBot 启动时，启动异步文件服务器"""
+    try:
+        # 启动时校验一次配置文件，配置有误时尽早报错，而不是等到第一次下载
+        await asyncio.to_thread(jmcomic.create_option_by_file, JM_OPTION_PATH)
+    except Exception as e:
+        logger.error(f"加载 JM 配置 {JM_OPTION_PATH} 失败: {e}")
+
     try:
         ROOT_DIR.mkdir(parents=True, exist_ok=True)
         await start_static_server(ROOT_DIR)
@@ -46,6 +110,33 @@ async def start_file_server():
 async def stop_file_server():
     """NoneBot 关闭时，关闭异步文件服务器"""
     await stop_static_server()
+    JM_EXECUTOR.shutdown(wait=False, cancel_futures=True)
+
+# 文件服务器的 URL 前缀只依赖配置，启动时算好一次
+FILE_URL_BASE = get_file_url("", PUBLIC_SERVER_IP)
+
+# bot.self_id -> (user_id, nickname)，登录信息在运行期间不会变化
+_BOT_INFO_CACHE = {}
+
+async def _get_bot_identity(bot: Bot):
+    """获取机器人的 QQ 号和昵称，只在首次调用时请求 get_login_info"""
+    identity = _BOT_INFO_CACHE.get(bot.self_id)
+    if identity is None:
+        info = await bot.get_login_info()
+        identity = (info["user_id"], info["nickname"])
+        _BOT_INFO_CACHE[bot.self_id] = identity
+    return identity
+
+def _scan_images(folder: Path) -> list:
+    """列出目录下的图片文件并排序（涉及大量 stat 调用，在线程中执行）"""
+    # scandir 返回的条目自带文件类型信息，通常不需要额外 stat
+    with os.scandir(folder) as entries:
+        names = [
+            entry.name for entry in entries
+            if entry.is_file() and entry.name.rpartition('.')[2].lower() in IMAGE_EXTENSIONS
+        ]
+    names.sort()
+    return [folder / name for name in names]
 
 @jm_cmd.handle()
 async def handle_jm(bot: Bot, event: GroupMessageEvent):
@@ -65,83 +156,84 @@ async def handle_jm(bot: Bot, event: GroupMessageEvent):
         # --- 1. 异步下载漫画 ---
         await jm_cmd.send(f"开始下载漫画 {comic_id}，这可能需要几分钟，请稍候...")
         
-        @run_sync
-        def _download_comic_sync():
-            option.download_album(int(comic_id))
-        
-        await _download_comic_sync()
+        async with _download_semaphores[event.group_id]:
+            try:
+                await asyncio.wait_for(
+                    asyncio.get_running_loop().run_in_executor(
+                        JM_EXECUTOR, _download_album, int(comic_id)
+                    ),
+                    timeout=DOWNLOAD_TIMEOUT,
+                )
+            except asyncio.TimeoutError:
+                # 线程中的下载无法被强制中断，这里只是不再等待，释放本群的下载名额
+                logger.warning(f"下载漫画 {comic_id} 超过 {DOWNLOAD_TIMEOUT} 秒，放弃等待")
+                await jm_cmd.finish(f"下载漫画 {comic_id} 超时，请稍后再试。")
         logger.info(f"Successfully downloaded comic with ID: {comic_id}")
 
         # --- 2. 检查下载目录是否存在 ---
-        if not comic_folder_path.is_dir():
+        if not await asyncio.to_thread(comic_folder_path.is_dir):
             await jm_cmd.finish(f"下载完成，但未找到对应的漫画目录: {comic_folder_path.resolve()}")
 
         # --- 3. 获取 Bot 信息 ---
-        bot_info = await bot.get_login_info()
-        bot_self_id = bot_info["user_id"]
-        bot_nickname = bot_info["nickname"]
+        bot_self_id, bot_nickname = await _get_bot_identity(bot)
         
-        forward_nodes = []
-
-        # --- 4. 遍历文件夹并构建图片节点 (这部分不变) ---
+        # --- 4. 遍历文件夹并构建图片节点 ---
         logger.info(f"开始遍历 {comic_folder_path} 中的图片...")
-        image_files = sorted(
-            [p for p in comic_folder_path.iterdir() 
-             if p.is_file() and p.suffix.lower() in IMAGE_EXTENSIONS]
-        )
+        image_files = await asyncio.to_thread(_scan_images, comic_folder_path)
 
         if not image_files:
             await jm_cmd.finish(f"漫画 {comic_id} 目录中未找到任何图片文件。")
 
-        for img_path in image_files:
-            try:
-                relative_path = img_path.relative_to(ROOT_DIR).as_posix()
-                image_url = get_file_url(relative_path, PUBLIC_SERVER_IP)
-                content = Message(MessageSegment.image(image_url))
-                
-                node = MessageSegment.node_custom(
-                    user_id=bot_self_id,
-                    nickname=bot_nickname,
-                    content=content
-                )
-                forward_nodes.append(node)
-                
-            except Exception as e:
-                logger.error(f"处理图片 {img_path} 失败: {e}")
-                forward_nodes.append(MessageSegment.node_custom(
-                    user_id=bot_self_id,
-                    nickname="系统错误",
-                    content=Message(f"加载图片 {img_path.name} 失败")
-                ))
+        # 节点构造只是纯对象创建，不再逐张 try/except；
+        # 所有图片在同一目录下，URL 前缀只算一次，逐张拼接文件名即可
+        url_prefix = f"{FILE_URL_BASE}{comic_folder_path.relative_to(ROOT_DIR).as_posix()}/"
+        make_image = MessageSegment.image
+        make_node = MessageSegment.node_custom
+        forward_nodes = [
+            make_node(
+                user_id=bot_self_id,
+                nickname=bot_nickname,
+                content=Message(make_image(url_prefix + img_path.name))
+            )
+            for img_path in image_files
+        ]
 
         if not forward_nodes:
             await jm_cmd.finish("未能成功构造任何消息节点。")
 
-        # --- 5. 【关键修改】分块发送合并转发消息 ---
-        
-        # 定义每个分块的大小
-        CHUNK_SIZE = 20
-        
-        total_chunks = (len(forward_nodes) + CHUNK_SIZE - 1) // CHUNK_SIZE
-        
-        for i in range(total_chunks):
-            # 计算当前块的起始和结束索引
-            start_index = i * CHUNK_SIZE
-            end_index = (i + 1) * CHUNK_SIZE
-            
-            # 从总列表中切片出当前块
-            current_chunk_nodes = forward_nodes[start_index:end_index]
-            
-            logger.info(f"正在发送 漫画 {comic_id} - (分块 {i+1}/{total_chunks})...")
-            
-            await bot.call_api(
-                "send_group_forward_msg",
-                group_id=event.group_id,
-                messages=current_chunk_nodes  # 传入当前块的节点列表
-            )
+        # --- 5. 发送合并转发消息 ---
+        # 页数不多时整本放进一条合并转发，一次 API 调用发完；
+        # 超出上限或协议端拒绝时，再退回按 CHUNK_SIZE 分块发送
+        total_chunks = 0
+        if len(forward_nodes) <= SINGLE_FORWARD_MAX_NODES:
+            try:
+                logger.info(f"正在发送 漫画 {comic_id} - (单条合并转发, {len(forward_nodes)} 个节点)...")
+                async with _send_throttlers[event.group_id]:
+                    await bot.call_api(
+                        "send_group_forward_msg",
+                        group_id=event.group_id,
+                        messages=forward_nodes
+                    )
+                total_chunks = 1
+            except ActionFailed as e:
+                logger.warning(f"漫画 {comic_id} 单条合并转发失败，改为分块发送: {e}")
+
+        if not total_chunks:
+            total_chunks = (len(forward_nodes) + CHUNK_SIZE - 1) // CHUNK_SIZE
             
-            # !!! 关键：在两次发送之间加入延时，避免触发风控 !!!
-            await asyncio.sleep(2) # 休息 2 秒
+            for i in range(total_chunks):
+                # 从总列表中切片出当前块
+                current_chunk_nodes = forward_nodes[i * CHUNK_SIZE:(i + 1) * CHUNK_SIZE]
+                
+                logger.info(f"正在发送 漫画 {comic_id} - (分块 {i+1}/{total_chunks})...")
+                
+                # !!! 关键：按群限速发送，避免触发风控 !!!
+                async with _send_throttlers[event.group_id]:
+                    await bot.call_api(
+                        "send_group_forward_msg",
+                        group_id=event.group_id,
+                        messages=current_chunk_nodes  # 传入当前块的节点列表
+                    )
 
         # --- 6. 修改最终回复 ---
         raw_message_id = event.message_id
@@ -154,6 +246,8 @@ async def handle_jm(bot: Bot, event: GroupMessageEvent):
             message=full_message
         )
     
+    except FinishedException:
+        raise
     except Exception as e:
         logger.error(f"处理漫画 {comic_id} 时出错: {e}")
         await jm_cmd.finish(f"获取或发送漫画 {comic_id} 时出错：{str(e)}")
\ No newline at end of file
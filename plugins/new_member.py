@@ -1,11 +1,12 @@
 from nonebot import on_request, on_notice, logger, get_driver
 from nonebot.adapters.onebot.v11 import Bot, GroupRequestEvent, GroupIncreaseNoticeEvent, MessageSegment
 from nonebot.plugin import PluginMetadata
-from utils.rules import allow_group_rule
+from utils.rules import allow_group_rule, allowed_groups
 import os
+import re
 import json
 import asyncio
-from collections import defaultdict
+from collections import defaultdict, deque
 from datetime import datetime
 
 __plugin_meta__ = PluginMetadata(
@@ -31,17 +32,41 @@ keywords = ['b站', 'bilibili', 'B站', '小红书', 'xhs', '知乎', '同学',
             'ict', '朋友', '学校', '老师', '计算所', '国科大', '软件所', '信工所']
 logger.info(f"加群申请关键词: {keywords}")
 
-# 新成员暂存列表：群ID -> [(用户ID, 用户名, 加入时间)]
-pending_welcomes = defaultdict(list)
+# 所有关键词编译成一个忽略大小写的正则，申请信息只需扫描一遍
+_keyword_pattern = re.compile("|".join(map(re.escape, keywords)), re.IGNORECASE)
+
+# 新成员暂存列表：群ID -> [(用户ID, 用户名, 加入时间)]，用户名在发送前才解析
+# 每个群最多暂存 50 人，超出时丢弃最早的
+MAX_PENDING_PER_GROUP = 50
+pending_welcomes = defaultdict(lambda: deque(maxlen=MAX_PENDING_PER_GROUP))
+
+# 批量欢迎：有人入群后最多等待 MAX_WAIT 秒合并发送，累计达到 MAX_BATCH 人时立即发送
+MAX_BATCH = 10
+MAX_WAIT = 60
+_has_pending = asyncio.Event()   # 有待欢迎的成员
+_batch_full = asyncio.Event()    # 待欢迎人数达到 MAX_BATCH
 
 # 获取驱动器用于定时任务
 driver = get_driver()
 
+def _display_name(member_info, user_id: int) -> str:
+    """群名片 > 昵称 > QQ号"""
+    if not member_info:
+        return str(user_id)
+    return member_info.get("card") or member_info.get("nickname") or str(user_id)
+
 async def send_batch_welcome():
     """批量发送欢迎消息的定时任务"""
     while True:
         try:
-            await asyncio.sleep(60)  # 每60秒执行一次
+            # 没有新成员时一直挂起，不做空轮询
+            await _has_pending.wait()
+            try:
+                await asyncio.wait_for(_batch_full.wait(), timeout=MAX_WAIT)
+            except asyncio.TimeoutError:
+                pass
+            _has_pending.clear()
+            _batch_full.clear()
             
             if not pending_welcomes:
                 continue
@@ -57,19 +82,30 @@ async def send_batch_welcome():
             # 使用第一个可用的Bot
             bot = list(bots.values())[0]
             
-            # 处理每个群的新成员
-            groups_to_clear = []
-            for group_id, members in pending_welcomes.items():
+            # 处理每个群的新成员：先把该群的暂存队列整个取出，
+            # 发送期间新入群的成员会进入新队列，不会被误清空
+            for group_id in list(pending_welcomes):
+                members = pending_welcomes.pop(group_id, None)
                 if not members:
                     continue
                     
                 try:
                     # 检查群组是否在允许列表中
-                    from utils.rules import allowed_groups
                     if str(group_id) not in allowed_groups:
-                        groups_to_clear.append(group_id)
                         continue
                     
+                    # 一次拉取群成员列表解析所有新成员的名字，而不是入群时逐个查询
+                    try:
+                        member_list = await bot.get_group_member_list(group_id=group_id)
+                        by_id = {m["user_id"]: m for m in member_list}
+                    except Exception as e:
+                        logger.warning(f"获取群 {group_id} 成员列表失败: {e}")
+                        by_id = {}
+                    members = [
+                        (user_id, _display_name(by_id.get(user_id), user_id), join_time)
+                        for user_id, _, join_time in members
+                    ]
+                    
                     # 构造批量欢迎消息
                     if len(members) == 1:
                         # 单个成员
@@ -93,15 +129,9 @@ async def send_batch_welcome():
                     )
                     
                     logger.info(f"已向群 {group_id} 的 {len(members)} 位新成员发送批量欢迎消息")
-                    groups_to_clear.append(group_id)
                     
                 except Exception as e:
                     logger.error(f"发送群 {group_id} 批量欢迎消息失败: {e}")
-                    groups_to_clear.append(group_id)
-            
-            # 清空已处理的群组
-            for group_id in groups_to_clear:
-                pending_welcomes[group_id].clear()
                 
         except Exception as e:
             logger.error(f"批量欢迎任务执行失败: {e}")
@@ -124,7 +154,6 @@ async def handle_group_request(bot: Bot, event: GroupRequestEvent):
             return
         
         # 检查群组是否在允许列表中
-        from utils.rules import allowed_groups
         if str(event.group_id) not in allowed_groups:
             logger.info(f"群 {event.group_id} 不在允许列表中，跳过处理")
             return
@@ -137,14 +166,9 @@ async def handle_group_request(bot: Bot, event: GroupRequestEvent):
         logger.info(f"收到加群申请: 群{group_id}, 用户{user_id}, 申请信息: {comment}")
         
         # 检查申请信息是否包含关键词
-        should_approve = False
-        matched_keyword = None
-        
-        for keyword in keywords:
-            if keyword.lower() in comment.lower():
-                should_approve = True
-                matched_keyword = keyword
-                break
+        match = _keyword_pattern.search(comment)
+        should_approve = match is not None
+        matched_keyword = match.group(0) if match else None
         
         if should_approve:
             # 自动同意申请
@@ -197,7 +221,6 @@ async def handle_group_increase(bot: Bot, event: GroupIncreaseNoticeEvent):
             return
             
         # 检查群组是否在允许列表中
-        from utils.rules import allowed_groups
         if str(event.group_id) not in allowed_groups:
             return
         
@@ -211,21 +234,14 @@ async def handle_group_increase(bot: Bot, event: GroupIncreaseNoticeEvent):
         
         logger.info(f"新成员 {user_id} 加入群 {group_id}，已添加到待欢迎列表")
         
-        # 获取用户信息
-        try:
-            member_info = await bot.get_group_member_info(
-                group_id=group_id,
-                user_id=user_id
-            )
-            username = member_info.get("card") or member_info.get("nickname") or str(user_id)
-        except:
-            username = str(user_id)
-        
-        # 添加到待欢迎列表
+        # 添加到待欢迎列表，用户名在批量发送时统一解析
         join_time = datetime.now()
-        pending_welcomes[group_id].append((user_id, username, join_time))
+        pending_welcomes[group_id].append((user_id, None, join_time))
+        _has_pending.set()
+        if sum(len(v) for v in pending_welcomes.values()) >= MAX_BATCH:
+            _batch_full.set()
         
-        logger.info(f"新成员 {username}({user_id}) 已添加到群 {group_id} 的待欢迎列表，当前列表长度: {len(pending_welcomes[group_id])}")
+        logger.info(f"新成员 {user_id} 已添加到群 {group_id} 的待欢迎列表，当前列表长度: {len(pending_welcomes[group_id])}")
         
     except Exception as e:
         logger.error(f"处理新成员入群时发生错误: {e}")
\ No newline at end of file
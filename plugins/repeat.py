@@ -3,6 +3,7 @@ from nonebot import on_message, get_driver, logger
 from nonebot.adapters.onebot.v11 import Bot, GroupMessageEvent, Message
 from nonebot.typing import T_State
 from nonebot.plugin import PluginMetadata
+from nonebot.rule import Rule
 from collections import defaultdict
 from utils.rules import allow_group_rule
 import random
@@ -48,6 +49,9 @@ def should_repeat(repeat_count: int) -> bool:
     logger.debug(f"复读次数: {repeat_count}, 复读概率: {probability}%")
     return random.random() * 100 < probability
 
+# 不参与复读的消息前缀：命令、标签
+_SKIP_PREFIXES = ('/', '#')
+
 def normalize_message(message_text: str) -> str:
     """
     标准化消息内容，用于比较是否为同一条消息
@@ -59,23 +63,14 @@ def is_valid_repeat_message(message_text: str) -> bool:
     """
     判断消息是否适合复读
     过滤掉一些不适合复读的消息类型
+    传入的应是 normalize_message 处理后的文本，这里不再 strip
     """
-    if not message_text or not message_text.strip():
-        return False
-    
-    # 过滤掉太短的消息（如单个字符、表情等）
-    if len(message_text.strip()) < 2:
-        return False
-    
-    # 过滤掉以 / 开头的命令消息
-    if message_text.strip().startswith('/'):
-        return False
-    
-    # 过滤掉以 # 开头的标签消息
-    if message_text.strip().startswith('#'):
+    # 过滤掉空消息和太短的消息（如单个字符、表情等）
+    if len(message_text) < 2:
         return False
     
-    return True
+    # 过滤掉以 / 开头的命令消息和以 # 开头的标签消息
+    return not message_text.startswith(_SKIP_PREFIXES)
 
 # 启动时初始化
 driver = get_driver()
@@ -84,8 +79,16 @@ driver = get_driver()
 async def startup():
     logger.info("复读机插件已启动")
 
+async def _is_repeat_candidate(event: GroupMessageEvent, state: T_State) -> bool:
+    """在匹配阶段过滤掉不适合复读的消息，不进入处理函数；标准化后的文本存入 state 供处理函数复用"""
+    text = normalize_message(event.get_plaintext())
+    if not is_valid_repeat_message(text):
+        return False
+    state["repeat_text"] = text
+    return True
+
 # 监听所有群消息
-repeat_handler = on_message(rule=allow_group_rule, priority=20, block=False)
+repeat_handler = on_message(rule=allow_group_rule & Rule(_is_repeat_candidate), priority=20, block=False)
 
 @repeat_handler.handle()
 async def handle_repeat(bot: Bot, event: GroupMessageEvent, state: T_State):
@@ -93,11 +96,8 @@ async def handle_repeat(bot: Bot, event: GroupMessageEvent, state: T_State):
     try:
         group_id = event.group_id
         user_id = event.user_id
-        current_message = normalize_message(event.get_plaintext())
-        
-        # 检查消息是否适合复读
-        if not is_valid_repeat_message(current_message):
-            return
+        # 是否适合复读已由 _is_repeat_candidate 规则检查，并已存入标准化后的文本
+        current_message = state["repeat_text"]
         
         # 获取当前群的复读状态
         status = group_repeat_status[group_id]
@@ -109,13 +109,14 @@ async def handle_repeat(bot: Bot, event: GroupMessageEvent, state: T_State):
                 return
             
             # 增加复读次数
-            status["repeat_count"] += 1
+            repeat_count = status["repeat_count"] + 1
+            status["repeat_count"] = repeat_count
             status["last_user_id"] = user_id
             
-            logger.debug(f"群 {group_id} 复读计数: {current_message[:20]}... x{status['repeat_count']}")
+            logger.debug(f"群 {group_id} 复读计数: {current_message[:20]}... x{repeat_count}")
             
             # 判断是否应该复读
-            if not status["bot_repeated"] and should_repeat(status["repeat_count"]):
+            if not status["bot_repeated"] and should_repeat(repeat_count):
                 try:
                     # 机器人复读
                     await bot.send_group_msg(
@@ -126,7 +127,7 @@ async def handle_repeat(bot: Bot, event: GroupMessageEvent, state: T_State):
                     # 标记已复读
                     status["bot_repeated"] = True
                     
-                    logger.info(f"群 {group_id} 机器人复读: {current_message[:20]}... (复读次数: {status['repeat_count']})")
+                    logger.info(f"群 {group_id} 机器人复读: {current_message[:20]}... (复读次数: {repeat_count})")
                     
                 except Exception as e:
                     logger.error(f"发送复读消息失败: {e}")
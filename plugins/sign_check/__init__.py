@@ -1,12 +1,16 @@
+import asyncio
+import hashlib
 from pathlib import Path
-from nonebot import on_message, logger
-from nonebot.adapters.onebot.v11 import Bot, PrivateMessageEvent, MessageSegment
+from nonebot import on_message, logger, get_driver
+from nonebot.adapters.onebot.v11 import Bot, Event, PrivateMessageEvent, MessageSegment
+from nonebot.rule import Rule
 from nonebot.plugin import PluginMetadata
-import aiohttp
 import aiofiles
+from cachetools import TTLCache
 
-from .ocr import OCRValidationError, QPSLimitError, ocr_check
-from .model import check_binding_conflict, create_binding
+from .ocr import OCRValidationError, QPSLimitError, ocr_check, get_http_session, close_http_session
+from .model import check_binding_conflict, create_binding, is_image_processed, record_image_hash
+from .model import engine as binding_engine
 
 DATA_DIR = Path("data")
 IMAGES_DIR = DATA_DIR / "sign_check_images"
@@ -20,16 +24,49 @@ __plugin_meta__ = PluginMetadata(
     supported_adapters={"~onebot.v11", "~onebot.v12"},
 )
 
-chat_recorder = on_message(priority=10, block=False)
+driver = get_driver()
+
+@driver.on_shutdown
+async def _close_resources():
+    """关闭时释放共享的 HTTP 连接池和数据库连接池"""
+    await close_http_session()
+    await binding_engine.dispose()
+
+# 报考群群号，校验通过后向用户发送该群的分享卡片
+SIGN_GROUP_ID = '665145078'
+
+# 群分享卡片缓存：group_id -> ArkShareGroup 返回的卡片数据，1 小时内复用
+_ark_cache: TTLCache = TTLCache(maxsize=16, ttl=3600)
+
+async def _get_group_ark(bot: Bot, group_id: str):
+    """获取群分享卡片，命中缓存时不再调用 ArkShareGroup"""
+    ark = _ark_cache.get(group_id)
+    if ark is None:
+        ark = await bot.call_api("ArkShareGroup", group_id=group_id)
+        _ark_cache[group_id] = ark
+    return ark
+
+# 后台归档任务的引用，防止任务在完成前被垃圾回收
+_archive_tasks = set()
+
+async def _archive_image(path: Path, content: bytes):
+    """后台保存图片到本地，仅用于归档，失败只记录日志"""
+    try:
+        async with aiofiles.open(path, "wb") as f:
+            await f.write(content)
+    except Exception as e:
+        logger.error(f"保存图片 {path} 失败: {e}")
+
+def _is_private_image(event: Event) -> bool:
+    """只处理带图片的私聊消息，其余消息在匹配阶段直接跳过"""
+    return isinstance(event, PrivateMessageEvent) and bool(event.get_message()["image"])
+
+chat_recorder = on_message(rule=Rule(_is_private_image), priority=10, block=False)
 
 @chat_recorder.handle()
 async def handle_sign_check(bot: Bot, event: PrivateMessageEvent):
-    message = event.get_message()
-    image_segments = message["image"]
-    if not image_segments:
-        # 消息中没有图片，不处理 (函数在此结束)
-        logger.debug(f"用户 {event.user_id} 发送的不是图片，已忽略。")
-        return
+    # 是否为带图片的私聊消息已由 _is_private_image 规则检查
+    image_segments = event.get_message()["image"]
     
     try:
         first_image: MessageSegment = image_segments[0]
@@ -43,9 +80,16 @@ async def handle_sign_check(bot: Bot, event: PrivateMessageEvent):
 
         image_name = first_image.data.get("file")
         image_path = IMAGES_DIR / f"{image_name}"
-        # 检查该图片是否已存在，避免重复保存
-        if image_path.exists():
-            logger.info(f"图片已存在，跳过保存: {image_path}")
+
+        # 先下载图片按内容哈希去重：换个文件名重发同一张图也不会再次调用收费的 OCR 接口
+        session = await get_http_session()
+        async with session.get(image_url) as response:
+            # 哈希会作为永久的去重键，错误页或过期链接的响应不能参与计算
+            response.raise_for_status()
+            content = await response.read()
+        image_hash = hashlib.sha256(content).hexdigest()
+        if await is_image_processed(image_hash):
+            logger.info(f"图片已处理过，跳过校验: {image_hash}")
             await chat_recorder.send("你发送的图片已被处理过，请勿重复发送相同图片。")
             return
     except Exception as e:
@@ -70,19 +114,20 @@ async def handle_sign_check(bot: Bot, event: PrivateMessageEvent):
         # 捕获 ocr_check 内部可能发生的未知错误
         logger.error(f"ocr_check 函数执行失败: {e}")
         await chat_recorder.send("图片校验功能内部错误，请联系管理员。")
+        return
 
     if result:
-        check_result = check_binding_conflict(event.user_id, signup_id)
+        check_result = await check_binding_conflict(event.user_id, signup_id)
         if check_result:
             await chat_recorder.send(f"校验失败：{check_result}")
             return
         
-        creation_success = create_binding(event.user_id, signup_id)
+        creation_success = await create_binding(event.user_id, signup_id)
         if creation_success:
+            await record_image_hash(image_hash, event.user_id)
             await chat_recorder.send(f"校验成功！报名号 {signup_id} 已绑定到你的 QQ 账号。你已被拉入报考群，请注意查收邀请。")
-            result = await bot.call_api("ArkShareGroup", group_id='665145078')
-            card_message = MessageSegment.json(data=result)
             try:
+                card_message = MessageSegment.json(data=await _get_group_ark(bot, SIGN_GROUP_ID))
                 await bot.send_private_msg(
                     user_id=event.user_id,
                     message=card_message
@@ -93,11 +138,7 @@ async def handle_sign_check(bot: Bot, event: PrivateMessageEvent):
         else:
             await chat_recorder.send("校验失败：创建绑定时发生错误，请稍后重试或联系管理员。")
 
-        # 下载图片
-        async with aiohttp.ClientSession() as session:
-            async with session.get(image_url) as response:
-                content = await response.read()
-
-        # 保存图片到本地
-        async with aiofiles.open(image_path, "wb") as f:
-            await f.write(content)
+        # 保存图片到本地：放到后台任务中，不阻塞对用户的回复
+        task = asyncio.create_task(_archive_image(image_path, content))
+        _archive_tasks.add(task)
+        task.add_done_callback(_archive_tasks.discard)
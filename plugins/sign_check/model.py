@@ -1,10 +1,13 @@
 import os
+from datetime import datetime
 from pathlib import Path
 from typing import Dict, Any, Optional
+from loguru import logger
 
-from sqlalchemy import create_engine, Column, String, BigInteger, Index
+from sqlalchemy import create_engine, select, or_, Column, String, BigInteger, DateTime, Index
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
 # 1. 数据库配置
 # 从环境变量读取，或使用默认的 sqlite 文件路径
@@ -44,6 +47,19 @@ class UserBinding(Base):
         """字符串表示"""
         return f"UserBinding(QQ: {self.qq_id}, sign ID: {self.sign_id})"
 
+class ImageHash(Base):
+    """已成功校验过的报考截图（按内容哈希去重）"""
+    __tablename__ = "image_hashes"
+    
+    # 主键：图片内容的 SHA-256
+    sha256 = Column(String(64), primary_key=True)
+    qq_id = Column(BigInteger, nullable=False)
+    processed_at = Column(DateTime, nullable=False, default=datetime.now)
+    
+    def __str__(self):
+        """字符串表示"""
+        return f"ImageHash(sha256: {self.sha256}, QQ: {self.qq_id})"
+
 # 3. 数据库初始化
 def init_database():
     """
@@ -68,66 +84,96 @@ def init_database():
     return engine
 
 # 4. 创建全局引擎和 SessionLocal
-# 脚本加载时执行初始化
-engine = init_database()
+# 脚本加载时用同步引擎建表，之后的读写全部走异步引擎，不阻塞事件循环
+init_database().dispose()
+
+def _to_async_url(url: str) -> str:
+    """sqlite:///... -> sqlite+aiosqlite:///...，其他已带驱动的 URL 原样返回"""
+    if url.startswith("sqlite:"):
+        return "sqlite+aiosqlite:" + url[len("sqlite:"):]
+    return url
+
+engine = create_async_engine(
+    _to_async_url(DATABASE_URL),
+    echo=False,
+    poolclass=AsyncAdaptedQueuePool,
+    pool_size=10,
+)
 # 创建一个 Session 工厂，插件将使用它来创建会话
-SessionLocal = sessionmaker(bind=engine)
+SessionLocal = async_sessionmaker(bind=engine, expire_on_commit=False)
 
-def check_binding_conflict(qq_id: int, sign_id_to_bind: str) -> Optional[str]:
+async def check_binding_conflict(qq_id: int, sign_id_to_bind: str) -> Optional[str]:
     """
-    校验绑定冲突 (同步版本)
+    校验绑定冲突
     
     :return: 冲突原因(str) 或 None(无冲突)
     """
-    # 从 Session 工厂创建一个新会话
-    session: Session = SessionLocal()
-    try:
-        # 1. 校验：这个QQ是否被绑定了别的人名
-        existing_binding_qq = session.query(UserBinding).filter(
-            UserBinding.qq_id == qq_id
-        ).one_or_none()
-        
-        if existing_binding_qq:
-            if existing_binding_qq.sign_id == sign_id_to_bind:
-                return f"你已经绑定过报名号为 {sign_id_to_bind} 的信息，无需重复绑定。"
-            else:
-                return f"你的 QQ ({qq_id}) 已经绑定过其他报名号 ({existing_binding_qq.sign_id})。"
+    async with SessionLocal() as session:
+        # 一次查询同时取出“该QQ的绑定”和“该报名号的绑定”（最多两行）
+        rows = (await session.execute(
+            select(UserBinding).where(or_(
+                UserBinding.qq_id == qq_id,
+                UserBinding.sign_id == sign_id_to_bind,
+            ))
+        )).scalars().all()
+    
+    existing_binding_qq = next((row for row in rows if row.qq_id == qq_id), None)
+    existing_binding_sign_id = next((row for row in rows if row.sign_id == sign_id_to_bind), None)
+    
+    # 1. 校验：这个QQ是否被绑定了别的人名
+    if existing_binding_qq:
+        if existing_binding_qq.sign_id == sign_id_to_bind:
+            return f"你已经绑定过报名号为 {sign_id_to_bind} 的信息，无需重复绑定。"
+        else:
+            return f"你的 QQ ({qq_id}) 已经绑定过其他报名号 ({existing_binding_qq.sign_id})。"
 
-        # 2. 校验：这个人名是否已经被使用过
-        existing_binding_sign_id = session.query(UserBinding).filter(
-            UserBinding.sign_id == sign_id_to_bind
-        ).one_or_none()
-        
-        if existing_binding_sign_id:
-            # 名字被别人占用了
-            return f"报名号 {sign_id_to_bind} 已经被 QQ ({str(existing_binding_sign_id.qq_id)[:4]}...) 绑定使用。"
-            
-    finally:
-        # 无论如何都要关闭会话
-        session.close()
-        
+    # 2. 校验：这个人名是否已经被使用过
+    if existing_binding_sign_id:
+        # 名字被别人占用了
+        return f"报名号 {sign_id_to_bind} 已经被 QQ ({str(existing_binding_sign_id.qq_id)[:4]}...) 绑定使用。"
+    
     # 3. 没有冲突
     return None
 
-def create_binding(qq_id: int, sign_id_to_bind: str) -> bool:
+async def create_binding(qq_id: int, sign_id_to_bind: str) -> bool:
+    """
+    创建新的绑定
+    
+    :return: True (成功) / False (失败)
+    """
+    async with SessionLocal() as session:
+        try:
+            # 创建新对象并提交
+            session.add(UserBinding(qq_id=qq_id, sign_id=sign_id_to_bind))
+            await session.commit()
+            return True
+        except Exception as e:
+            # 如果发生错误（例如 unique 约束失败），回滚事务
+            await session.rollback()
+            print(f"创建绑定失败: {e}")
+            return False
+
+async def is_image_processed(sha256: str) -> bool:
+    """
+    检查该图片内容是否已经校验并绑定过
+    
+    :return: True (已处理) / False (未处理)
+    """
+    async with SessionLocal() as session:
+        return await session.get(ImageHash, sha256) is not None
+
+async def record_image_hash(sha256: str, qq_id: int) -> bool:
     """
-    创建新的绑定 (同步版本)
+    记录已成功校验的图片哈希
     
     :return: True (成功) / False (失败)
     """
-    session: Session = SessionLocal()
-    try:
-        # 创建新对象
-        new_binding = UserBinding(qq_id=qq_id, sign_id=sign_id_to_bind)
-        # 添加到会话
-        session.add(new_binding)
-        # 提交事务
-        session.commit()
-        return True
-    except Exception as e:
-        # 如果发生错误（例如 unique 约束失败），回滚事务
-        session.rollback()
-        print(f"创建绑定失败: {e}")
-        return False
-    finally:
-        session.close()
\ No newline at end of file
+    async with SessionLocal() as session:
+        try:
+            session.add(ImageHash(sha256=sha256, qq_id=qq_id))
+            await session.commit()
+            return True
+        except Exception as e:
+            await session.rollback()
+            logger.error(f"记录图片哈希失败: {e}")
+            return False
@@ -2,16 +2,44 @@ import asyncio
 import logging
 import os
 import sys
+import time
 import aiohttp
+from collections import OrderedDict
 from urllib import parse
 from datetime import datetime
-from typing import Tuple, TypedDict
+from typing import Optional, Tuple, TypedDict
+
+try:
+    import orjson
+    loads_json = orjson.loads
+except ImportError:
+    import json
+    loads_json = json.loads
 
 API_KEY = os.getenv("OCR_API_KEY")
 SECRET_KEY = os.getenv("OCR_SECRET_KEY")
 
 YEAR = 2026
 CHECKPOINT = "2025-10-27T22:00:00"
+_CHECKPOINT_DT = datetime.fromisoformat(CHECKPOINT)
+
+# 全局复用的 HTTP 会话：OCR、Access Token 和图片下载共用连接池，避免每次请求重新握手
+_session: Optional[aiohttp.ClientSession] = None
+
+async def get_http_session() -> aiohttp.ClientSession:
+    """获取共享的 aiohttp 会话，首次调用时创建"""
+    global _session
+    if _session is None or _session.closed:
+        connector = aiohttp.TCPConnector(limit=20, ttl_dns_cache=300, keepalive_timeout=60)
+        _session = aiohttp.ClientSession(connector=connector)
+    return _session
+
+async def close_http_session():
+    """关闭共享的 aiohttp 会话"""
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
 
 class OCRValidationError(Exception):
     """自定义异常类，用于表示 OCR 校验失败的情况"""
@@ -30,8 +58,36 @@ class OCRResult(TypedDict):
     words_result_num: int
     log_id: str
 
+# OCR 结果缓存：同一张图片重复提交时不再调用（收费的）OCR 接口
+OCR_CACHE_SIZE = 1024
+_ocr_cache: "OrderedDict[str, OCRResult]" = OrderedDict()
+# QQ 图片链接中每次下发都会变化的签名参数，不参与缓存键
+_VOLATILE_URL_PARAMS = frozenset({"rkey"})
+
+def _ocr_cache_key(image_url: str) -> str:
+    """去掉链接中易变的签名参数，保留能标识图片本身的部分"""
+    parts = parse.urlsplit(image_url)
+    query = sorted(
+        (k, v) for k, v in parse.parse_qsl(parts.query, keep_blank_values=True)
+        if k not in _VOLATILE_URL_PARAMS
+    )
+    return f"{parts.netloc}{parts.path}?{parse.urlencode(query)}"
+
 # 从百度 OCR API 获取识别结果
 async def get_ocr_result(image_url) -> OCRResult:
+    cache_key = _ocr_cache_key(image_url)
+    cached = _ocr_cache.get(cache_key)
+    if cached is not None:
+        _ocr_cache.move_to_end(cache_key)
+        return cached
+
+    result = await _request_ocr(image_url)
+    _ocr_cache[cache_key] = result
+    if len(_ocr_cache) > OCR_CACHE_SIZE:
+        _ocr_cache.popitem(last=False)
+    return result
+
+async def _request_ocr(image_url) -> OCRResult:
     token = await get_access_token()
     if token is None:
         raise RuntimeError("无法获取 OCR API 的 Access Token")
@@ -45,33 +101,55 @@ async def get_ocr_result(image_url) -> OCRResult:
         'Accept': 'application/json',
     }
 
-    async with aiohttp.ClientSession() as session:
-        async with session.post(url, headers=headers, data=payload.encode("utf-8")) as resp:
-            response_json = await resp.json()
-            if error_code := response_json.get("error_code"):
-                match error_code:
-                    case 18:
-                        raise QPSLimitError
-                    case _:
-                        raise RuntimeError(f"OCR API 返回错误，错误码: {error_code}, 信息: {response_json.get('error_msg')}")
-
-            return OCRResult(
-                words_result=response_json.get("words_result", []),
-                words_result_num=response_json.get("words_result_num", 0),
-                log_id=response_json.get("log_id", "")
-            )
+    session = await get_http_session()
+    async with session.post(url, headers=headers, data=payload.encode("utf-8")) as resp:
+        # 直接解析原始字节，省去 aiohttp 默认的解码 + json.loads
+        response_json = loads_json(await resp.read())
+        if error_code := response_json.get("error_code"):
+            match error_code:
+                case 18:
+                    raise QPSLimitError
+                case _:
+                    raise RuntimeError(f"OCR API 返回错误，错误码: {error_code}, 信息: {response_json.get('error_msg')}")
+
+        return OCRResult(
+            words_result=response_json.get("words_result", []),
+            words_result_num=response_json.get("words_result_num", 0),
+            log_id=response_json.get("log_id", "")
+        )
+
+# Access Token 缓存：(token, 过期时刻 monotonic)。百度的 token 有效期约 30 天，提前 5 分钟刷新
+_token_cache: Optional[Tuple[str, float]] = None
+_token_lock = asyncio.Lock()
+TOKEN_REFRESH_MARGIN = 300
 
 async def get_access_token() -> str | None:
     """
-    使用 AK，SK 生成鉴权签名（Access Token）
+    使用 AK，SK 生成鉴权签名（Access Token），有效期内直接返回缓存
     :return: access_token，或是None(如果错误)
     """
-    url = "https://aip.baidubce.com/oauth/2.0/token"
-    params = {"grant_type": "client_credentials", "client_id": API_KEY, "client_secret": SECRET_KEY}
-    async with aiohttp.ClientSession() as session:
-        async with session.post(url, params=params) as resp:
-            response_json = await resp.json()
-            return str(response_json.get("access_token"))
+    global _token_cache
+    async with _token_lock:
+        if _token_cache is not None and time.monotonic() < _token_cache[1] - TOKEN_REFRESH_MARGIN:
+            return _token_cache[0]
+
+        url = "https://aip.baidubce.com/oauth/2.0/token"
+        params = {"grant_type": "client_credentials", "client_id": API_KEY, "client_secret": SECRET_KEY}
+        try:
+            session = await get_http_session()
+            async with session.post(url, params=params) as resp:
+                response_json = loads_json(await resp.read())
+        except Exception:
+            _token_cache = None
+            raise
+
+        token = response_json.get("access_token")
+        if not token:
+            _token_cache = None
+            return None
+        expires_in = float(response_json.get("expires_in", 2592000))
+        _token_cache = (str(token), time.monotonic() + expires_in)
+        return _token_cache[0]
 
 # 从 OCR 结果中提取指定单元格对应的值
 def extract(result: OCRResult, key: str) -> str | None:
@@ -86,65 +164,99 @@ def extract(result: OCRResult, key: str) -> str | None:
 def extract_id(result: OCRResult) -> str | None:
     return extract(result, "考生报名号")
 
+# 各校验字段及其允许的取值前缀
+FIELD_RULES = {
+    "报考单位": ("14430",),
+    "报考专业": ("085404", "085410"),
+    "考试方式": ("21",),
+    "专项计划": ("0", "4", "7"),
+    "报考类别": ("11", "12"),
+    "报考院系所": ("216",),
+    "研究方向": ("01",),
+    "学习方式": ("全日制",),
+    "政治理论": ("101",),
+    "外国语": ("204",),
+    "业务课一": ("302",),
+    "业务课二": ("408",),
+}
+KEYS = ("考生报名号", *FIELD_RULES)
+_KEY_SET = frozenset(KEYS)
+_KEY_LENGTHS = sorted({len(key) for key in KEYS})
+
+def build_index(result: OCRResult) -> dict[str, str | None]:
+    """遍历一次 OCR 结果，建立 单元格名 -> 下一行的值 的索引，语义与 extract 一致"""
+    words_result = result["words_result"]
+    total = result["words_result_num"]
+    index: dict[str, str | None] = {}
+    for (i, item) in enumerate(words_result):
+        words = item["words"]
+        if not words.startswith(KEYS):
+            continue
+        for length in _KEY_LENGTHS:
+            key = words[:length]
+            if key in _KEY_SET:
+                # 只取第一次出现的位置；单元格位于最后一行时没有对应的值
+                if key not in index:
+                    index[key] = words_result[i + 1]["words"] if i + 1 < total else None
+                break
+    return index
+
 # 检查 OCR 结果中的各项内容是否符合预期
 def check(result: OCRResult, key: str, *args: str) -> bool:
     value = extract(result, key)
-    if value is not None:
-        return any(value.startswith(arg) for arg in args)
-    return False
+    # startswith 直接接受前缀元组，在 C 层逐个比较
+    return value is not None and value.startswith(args)
+
+def check_field(result: OCRResult, key: str) -> bool:
+    """按 FIELD_RULES 中预先构造好的前缀元组校验字段"""
+    value = extract(result, key)
+    return value is not None and value.startswith(FIELD_RULES[key])
 
 def check_school(result: OCRResult) -> bool:
-    return check(result, "报考单位", "14430")
+    return check_field(result, "报考单位")
 
 def check_major(result: OCRResult) -> bool:
-    return check(result, "报考专业", "085404", "085410")
+    return check_field(result, "报考专业")
 
 def check_exam(result: OCRResult) -> bool:
-    return check(result, "考试方式", "21")
+    return check_field(result, "考试方式")
 
 def check_plan(result: OCRResult) -> bool:
-    return check(result, "专项计划", "0", "4", "7")
+    return check_field(result, "专项计划")
 
 def check_type(result: OCRResult) -> bool:
-    return check(result, "报考类别", "11", "12")
+    return check_field(result, "报考类别")
 
 def check_department(result: OCRResult) -> bool:
-    return check(result, "报考院系所", "216")
+    return check_field(result, "报考院系所")
 
 def check_topic(result: OCRResult) -> bool:
-    return check(result, "研究方向", "01")
+    return check_field(result, "研究方向")
 
 def check_duration(result: OCRResult) -> bool:
-    return check(result, "学习方式", "全日制")
+    return check_field(result, "学习方式")
 
 def check_politics(result: OCRResult) -> bool:
-    return check(result, "政治理论", "101")
+    return check_field(result, "政治理论")
 
 def check_language(result: OCRResult) -> bool:
-    return check(result, "外国语", "204")
+    return check_field(result, "外国语")
 
 def check_math(result: OCRResult) -> bool:
-    return check(result, "业务课一", "302")
+    return check_field(result, "业务课一")
 
 def check_computer(result: OCRResult) -> bool:
-    return check(result, "业务课二", "408")
-
-def check_all(result: OCRResult) -> bool:
-    check_list = [
-        check_school,
-        check_major,
-        check_exam,
-        check_plan,
-        check_type,
-        check_department,
-        check_topic,
-        check_duration,
-        check_politics,
-        check_language,
-        check_math,
-        check_computer,
-    ]
-    return all(f(result) for f in check_list)
+    return check_field(result, "业务课二")
+
+def check_all(result: OCRResult, index: dict[str, str | None] | None = None) -> bool:
+    """一次遍历建立索引后逐项校验，不再为每个字段重新扫描 OCR 结果"""
+    if index is None:
+        index = build_index(result)
+    for key, prefixes in FIELD_RULES.items():
+        value = index.get(key)
+        if value is None or not value.startswith(prefixes):
+            return False
+    return True
 
 # 匹配报名信息标题和打印时间
 def match_title(result: OCRResult) -> bool:
@@ -158,12 +270,12 @@ def match_time(result: OCRResult) -> bool:
             try:
                 printed_time = datetime.strptime(item["words"][5:23], "%Y-%m-%d%H：%M：%S")
                 logging.debug(printed_time)
-                checkpoint = datetime.fromisoformat(CHECKPOINT)
                 # 如果打印时间在截止时间之后，认为有效
-                delta = printed_time - checkpoint
-                return delta.total_seconds() >= 0
+                return printed_time >= _CHECKPOINT_DT
             except Exception:
                 return False
+    # 没有找到打印时间
+    return False
 
 # OCR 校验主函数
 async def ocr_check(image_url: str) -> Tuple[str, str]:
@@ -179,11 +291,12 @@ async def ocr_check(image_url: str) -> Tuple[str, str]:
     if not match_time(result):
         raise OCRValidationError("图片中的打印时间无效，请确保报名表的打印时间在截止时间之后")
 
-    id = extract_id(result)
+    index = build_index(result)
+    id = index.get("考生报名号")
     if id is None:
         raise OCRValidationError("图片中未检测到有效的考生报名号")
 
-    if not check_all(result):
+    if not check_all(result, index):
         raise OCRValidationError("图片识别结果校验未通过，请确保图片清晰且信息完整。")
 
     return True, id
\ No newline at end of file
@@ -4,14 +4,18 @@ from nonebot.adapters.onebot.v11 import Bot, GroupMessageEvent, Message, Message
 from nonebot.plugin import PluginMetadata
 from utils.rules import allow_group_rule
 from datetime import datetime, timedelta
+from operator import itemgetter
 from PIL import Image, ImageDraw, ImageFont
 import os
 import io
+import bisect
+import functools
+import re
+import asyncio
 import sys
-import base64
 
 from utils.llm import llm_response
-from plugins.group_msg_collect import MessageRecorderAPI
+from plugins.group_msg_collect import MessageRecorderAPI, format_message
 
 __plugin_meta__ = PluginMetadata(
     name="省流插件",
@@ -43,58 +47,35 @@ system_prompt = '''
 summary_cmd = on_command("省流", rule=allow_group_rule, aliases={"总结", "summary"}, priority=5, block=True)
 
 async def get_recent_messages(group_id: int, limit_minutes: int = 10, target_count: int = 100):
-    """获取近期消息记录，优先按时间，不足则补足100条有效消息"""
-    # 先获取10分钟内的消息
-    time_limit = datetime.now() - timedelta(minutes=limit_minutes)
+    """获取近期消息记录：24小时内最新的100条有效消息，并返回其中近10分钟内的条数
     
-    # 获取10分钟内的消息
-    recent_messages = MessageRecorderAPI.get_messages(
-        group_id=group_id,
-        start_time=time_limit,
-        limit=200,  # 多获取一些确保有足够的有效消息
-        order_by="asc"
-    )
-    
-    # 过滤出有效的文本消息
-    valid_recent = []
-    for msg in recent_messages:
-        if msg.message_type == "text" and msg.plain_text:
-            valid_recent.append(msg)
-    
-    # 如果10分钟内的有效消息已经够100条，直接返回
-    if len(valid_recent) >= target_count:
-        return valid_recent[-target_count:]  # 返回最新的100条
-    
-    # 如果不够，则获取更多历史消息来补足100条
-    # 获取更多消息（不限时间，从更早的时间开始）
-    earlier_time = datetime.now() - timedelta(hours=24)  # 获取24小时内的消息
-    all_messages = MessageRecorderAPI.get_messages(
+    10分钟内的消息足够时结果全部落在10分钟内，否则自然由更早的历史消息补足，因此只需查询一次
+    """
+    now = datetime.now()
+    earlier_time = now - timedelta(hours=24)
+    messages = MessageRecorderAPI.get_messages(
         group_id=group_id,
         start_time=earlier_time,
-        limit=300,  # 获取更多消息确保能补足
+        message_type="text",
+        require_text=True,  # 类型和空文本在 SQL 中过滤
+        limit=target_count,
         order_by="desc"  # 从新到旧
     )
     
-    # 过滤有效消息
-    all_valid = []
-    for msg in all_messages:
-        if msg.message_type == "text" and msg.plain_text:
-            all_valid.append(msg)
-        if len(all_valid) >= target_count:
-            break
+    # 恢复时间顺序
+    messages.reverse()
     
-    # 恢复时间顺序并返回
-    all_valid.reverse()
-    return all_valid
+    # created_at 是同一格式的 ISO 字符串，按字符串比较即按时间比较，有序列表上二分即可得到条数
+    time_limit = (now - timedelta(minutes=limit_minutes)).isoformat()
+    recent_count = len(messages) - bisect.bisect_left(messages, time_limit, key=itemgetter('created_at'))
+    return messages, recent_count
 
-async def format_messages_for_llm(messages: list, bot: Bot, group_id: int):
+def format_messages_for_llm(messages: list) -> str:
     """格式化消息记录供LLM处理"""
     if not messages:
         return "无聊天记录"
     
-    formatted_messages = [str(msg) for msg in messages]
-    
-    return "\n".join(formatted_messages)
+    return "\n".join(map(format_message, messages))
 
 async def get_llm_summary(messages: str) -> str:
     """使用LLM生成总结"""
@@ -106,200 +87,225 @@ async def get_llm_summary(messages: str) -> str:
     except Exception as e:
         return f"生成总结时出错：{str(e)}"
 
-def create_summary_image(summary_text: str, stats_text: str) -> bytes:
-    """将总结文本转换为图片"""
-    # 图片基本设置
-    width = 600
-    padding = 40
-    line_height = 35
-    title_height = 60
-    stats_height = 40
-    
-    # 颜色设置
-    bg_color = (255, 255, 255)  # 白色背景
-    title_color = (52, 152, 219)  # 蓝色标题
-    text_color = (44, 62, 80)  # 深灰色文本
-    stats_color = (149, 165, 166)  # 浅灰色统计
-    border_color = (189, 195, 199)  # 边框颜色
-    
-    def load_font(size: int):
-        """加载字体，按优先级尝试"""
-        
-        # Windows 字体
-        if sys.platform == "win32":
-            windows_fonts = [
-                "C:/Windows/Fonts/msyh.ttc",
-                "C:/Windows/Fonts/simhei.ttf",
-                "C:/Windows/Fonts/simsun.ttc",
-                "C:/Windows/Fonts/arial.ttf"
-            ]
-            for font_path in windows_fonts:
-                try:
-                    if os.path.exists(font_path):
-                        return ImageFont.truetype(font_path, size)
-                except Exception:
-                    continue
-        
-        # Linux/Unix 字体路径
-        linux_fonts = [
-            # Ubuntu/Debian 中文字体
-            "/usr/share/fonts/truetype/wqy/wqy-zenhei.ttc",
-            "/usr/share/fonts/truetype/wqy/wqy-microhei.ttc", 
-            "/usr/share/fonts/truetype/arphic/uming.ttc",
-            "/usr/share/fonts/truetype/arphic/ukai.ttc",
-            "/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc",
-            "/usr/share/fonts/truetype/liberation/LiberationSans-Regular.ttf",
-            
-            # CentOS/RHEL 中文字体
-            "/usr/share/fonts/chinese/TrueType/uming.ttf",
-            "/usr/share/fonts/chinese/TrueType/ukai.ttf",
-            "/usr/share/fonts/wqy-zenhei/wqy-zenhei.ttc",
-            "/usr/share/fonts/wqy-microhei/wqy-microhei.ttc",
-            
-            # Alpine Linux
-            "/usr/share/fonts/TTF/DejaVuSans.ttf",
-            "/usr/share/fonts/liberation/LiberationSans-Regular.ttf",
-            
-            # Docker容器常见路径
-            "/app/fonts/NotoSansSC-Regular.otf",
-            "/fonts/simhei.ttf",
-            
-            # WSL Windows字体
-            "/mnt/c/Windows/Fonts/msyh.ttc",
-            "/mnt/c/Windows/Fonts/simhei.ttf",
-            
-            # macOS
-            "/System/Library/Fonts/PingFang.ttc",
-            "/Library/Fonts/Arial Unicode MS.ttf"
-        ]
-        
-        for font_path in linux_fonts:
-            try:
-                if os.path.exists(font_path):
-                    return ImageFont.truetype(font_path, size)
-            except Exception:
-                continue
-        
-        # 尝试系统默认字体
+# Windows 字体
+_WINDOWS_FONTS = [
+    "C:/Windows/Fonts/msyh.ttc",
+    "C:/Windows/Fonts/simhei.ttf",
+    "C:/Windows/Fonts/simsun.ttc",
+    "C:/Windows/Fonts/arial.ttf"
+]
+
+# Linux/Unix 字体路径
+_LINUX_FONTS = [
+    # Ubuntu/Debian 中文字体
+    "/usr/share/fonts/truetype/wqy/wqy-zenhei.ttc",
+    "/usr/share/fonts/truetype/wqy/wqy-microhei.ttc", 
+    "/usr/share/fonts/truetype/arphic/uming.ttc",
+    "/usr/share/fonts/truetype/arphic/ukai.ttc",
+    "/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/truetype/liberation/LiberationSans-Regular.ttf",
+
+    # CentOS/RHEL 中文字体
+    "/usr/share/fonts/chinese/TrueType/uming.ttf",
+    "/usr/share/fonts/chinese/TrueType/ukai.ttf",
+    "/usr/share/fonts/wqy-zenhei/wqy-zenhei.ttc",
+    "/usr/share/fonts/wqy-microhei/wqy-microhei.ttc",
+
+    # Alpine Linux
+    "/usr/share/fonts/TTF/DejaVuSans.ttf",
+    "/usr/share/fonts/liberation/LiberationSans-Regular.ttf",
+
+    # Docker容器常见路径
+    "/app/fonts/NotoSansSC-Regular.otf",
+    "/fonts/simhei.ttf",
+
+    # WSL Windows字体
+    "/mnt/c/Windows/Fonts/msyh.ttc",
+    "/mnt/c/Windows/Fonts/simhei.ttf",
+
+    # macOS
+    "/System/Library/Fonts/PingFang.ttc",
+    "/Library/Fonts/Arial Unicode MS.ttf"
+]
+
+def _resolve_font_path():
+    """按优先级查找第一个可用的字体文件，只在模块加载时执行一次"""
+    candidates = _LINUX_FONTS
+    if sys.platform == "win32":
+        candidates = _WINDOWS_FONTS + _LINUX_FONTS
+    for font_path in candidates:
         try:
-            return ImageFont.truetype("DejaVuSans.ttf", size)
-        except:
-            try:
-                return ImageFont.load_default()
-            except:
-                return None
+            if os.path.exists(font_path):
+                ImageFont.truetype(font_path, 12)
+                return font_path
+        except Exception:
+            continue
+
+    # 尝试系统默认字体（由 FreeType 在字体搜索路径中查找）
+    try:
+        ImageFont.truetype("DejaVuSans.ttf", 12)
+        return "DejaVuSans.ttf"
+    except Exception:
+        return None
+
+_FONT_PATH = _resolve_font_path()
+
+@functools.lru_cache(maxsize=16)
+def _get_font(size: int):
+    """按字号缓存字体对象；找不到可用字体时使用 Pillow 内置字体"""
+    if _FONT_PATH is None:
+        return ImageFont.load_default()
+    return ImageFont.truetype(_FONT_PATH, size)
+
+# 字体只在模块加载时查找、加载一次，每次生成图片直接复用
+_TITLE_FONT = _get_font(24)
+_TEXT_FONT = _get_font(18)
+_STATS_FONT = _get_font(14)
+
+# 在中文标点之后断开，标点保留在前一段末尾
+_CLAUSE_SPLIT = re.compile(r'(?<=[，。！？])')
+
+def _wrap_line(line: str, font, max_width: int) -> list:
+    """按实际像素宽度换行：优先在标点处断开，单个分句超宽时再按字符断开"""
+    output = []
+    buf = []
+    buf_width = 0
+    for clause in _CLAUSE_SPLIT.split(line):
+        if not clause:
+            continue
+        clause_width = font.getlength(clause)
+        if buf_width + clause_width <= max_width:
+            buf.append(clause)
+            buf_width += clause_width
+            continue
+        if buf:
+            output.append(''.join(buf))
+            buf = []
+            buf_width = 0
+        if clause_width <= max_width:
+            buf.append(clause)
+            buf_width = clause_width
+            continue
+        # 分句本身超过一行，逐字符填充
+        for char in clause:
+            char_width = font.getlength(char)
+            if buf and buf_width + char_width > max_width:
+                output.append(''.join(buf))
+                buf = []
+                buf_width = 0
+            buf.append(char)
+            buf_width += char_width
+    if buf:
+        output.append(''.join(buf))
+    return output
+
+# 图片基本设置
+IMAGE_WIDTH = 600
+PADDING = 40
+LINE_HEIGHT = 35
+TITLE_HEIGHT = 60
+STATS_HEIGHT = 40
+
+# 颜色设置
+BG_COLOR = (255, 255, 255)  # 白色背景
+TITLE_COLOR = (52, 152, 219)  # 蓝色标题
+TEXT_COLOR = (44, 62, 80)  # 深灰色文本
+STATS_COLOR = (149, 165, 166)  # 浅灰色统计
+BORDER_COLOR = (189, 195, 199)  # 边框颜色
+
+def _render_header() -> Image.Image:
+    """预先绘制固定不变的标题和分隔线，每次生成图片时直接贴上"""
+    header = Image.new('RGB', (IMAGE_WIDTH, PADDING + TITLE_HEIGHT), BG_COLOR)
+    draw = ImageDraw.Draw(header)
     
-    # 加载字体
-    title_font = load_font(24) or ImageFont.load_default()
-    text_font = load_font(18) or ImageFont.load_default()
-    stats_font = load_font(14) or ImageFont.load_default()
+    # 绘制标题
+    title = "聊天总结"
+    title_bbox = draw.textbbox((0, 0), title, font=_TITLE_FONT)
+    title_width = title_bbox[2] - title_bbox[0]
+    title_x = (IMAGE_WIDTH - title_width) // 2
+    draw.text((title_x, PADDING), title, fill=TITLE_COLOR, font=_TITLE_FONT)
     
+    # 绘制分隔线
+    line_y = PADDING + TITLE_HEIGHT - 10
+    draw.line([PADDING, line_y, IMAGE_WIDTH - PADDING, line_y], fill=BORDER_COLOR, width=1)
+    return header
+
+_HEADER = _render_header()
+
+@functools.lru_cache(maxsize=32)
+def _canvas_template(height: int) -> Image.Image:
+    """按图片高度缓存画布模板（背景、边框和标题），生成图片时复制一份再绘制正文"""
+    canvas = Image.new('RGB', (IMAGE_WIDTH, height), BG_COLOR)
+    canvas.paste(_HEADER, (0, 0))
+    draw = ImageDraw.Draw(canvas)
+    # 绘制边框（随图片高度变化）
+    draw.rectangle([5, 5, IMAGE_WIDTH-5, height-5], outline=BORDER_COLOR, width=2)
+    return canvas
+
+def create_summary_image(summary_text: str, stats_text: str) -> io.BytesIO:
+    """将总结文本转换为图片，返回 WebP 数据所在的缓冲区"""
     # 文本换行处理
-    max_width = width - 2 * padding
+    max_width = IMAGE_WIDTH - 2 * PADDING
     wrapped_lines = []
     
     for line in summary_text.split('\n'):
         if line.strip():
-            # 简单的文本换行（基于字符数估算）
-            chars_per_line = max_width // 20  # 估算每行字符数
-            if len(line) <= chars_per_line:
-                wrapped_lines.append(line)
-            else:
-                # 按标点符号和空格分割
-                words = line.replace('，', '，\n').replace('。', '。\n').replace('！', '！\n').replace('？', '？\n').split('\n')
-                current_line = ""
-                for word in words:
-                    if len(current_line + word) <= chars_per_line:
-                        current_line += word
-                    else:
-                        if current_line:
-                            wrapped_lines.append(current_line)
-                        current_line = word
-                if current_line:
-                    wrapped_lines.append(current_line)
+            wrapped_lines.extend(_wrap_line(line, _TEXT_FONT, max_width))
         else:
             wrapped_lines.append("")
     
     # 计算图片高度
-    content_height = len(wrapped_lines) * line_height
-    total_height = padding * 2 + title_height + content_height + stats_height + 20
+    content_height = len(wrapped_lines) * LINE_HEIGHT
+    total_height = PADDING * 2 + TITLE_HEIGHT + content_height + STATS_HEIGHT + 20
     
-    # 创建图片
-    img = Image.new('RGB', (width, total_height), bg_color)
+    # 复制同一高度的画布模板，只绘制正文和统计信息
+    img = _canvas_template(total_height).copy()
     draw = ImageDraw.Draw(img)
     
-    # 绘制边框
-    draw.rectangle([5, 5, width-5, total_height-5], outline=border_color, width=2)
-    
-    # 绘制标题
-    title = "聊天总结"
-    title_bbox = draw.textbbox((0, 0), title, font=title_font)
-    title_width = title_bbox[2] - title_bbox[0]
-    title_x = (width - title_width) // 2
-    draw.text((title_x, padding), title, fill=title_color, font=title_font)
-    
-    # 绘制分隔线
-    line_y = padding + title_height - 10
-    draw.line([padding, line_y, width-padding, line_y], fill=border_color, width=1)
-    
     # 绘制总结内容
-    y = padding + title_height + 10
+    y = PADDING + TITLE_HEIGHT + 10
     for line in wrapped_lines:
         if line.strip():
-            draw.text((padding, y), line, fill=text_color, font=text_font)
-        y += line_height
+            draw.text((PADDING, y), line, fill=TEXT_COLOR, font=_TEXT_FONT)
+        y += LINE_HEIGHT
     
     # 绘制统计信息
-    stats_y = total_height - stats_height - padding
-    draw.text((padding, stats_y), stats_text, fill=stats_color, font=stats_font)
+    stats_y = total_height - STATS_HEIGHT - PADDING
+    draw.text((PADDING, stats_y), stats_text, fill=STATS_COLOR, font=_STATS_FONT)
     
-    # 转换为字节
+    # WebP 编码比 PNG 的 deflate 快且体积更小；直接返回缓冲区，由调用方按需读取
     img_buffer = io.BytesIO()
-    img.save(img_buffer, format='PNG')
-    return img_buffer.getvalue()
+    img.save(img_buffer, format='WEBP', quality=90, method=4)
+    return img_buffer
 
 @summary_cmd.handle()
 async def handle_summary(bot: Bot, event: GroupMessageEvent):
     try:
         group_id = event.group_id
         
-        # 发送处理中提示
-        await summary_cmd.send("🔄 正在分析近期聊天记录，请稍候...")
+        # 发送处理中提示：与查询消息、生成总结并行进行
+        notice_task = asyncio.create_task(summary_cmd.send("🔄 正在分析近期聊天记录，请稍候..."))
         
-        # 获取近期消息（已自动过滤图片等无效消息）
-        messages = await get_recent_messages(group_id)
+        try:
+            # 获取近期消息（已自动过滤图片等无效消息）
+            messages, recent_count = await get_recent_messages(group_id)
+            
+            if messages:
+                # 格式化消息
+                formatted_messages = format_messages_for_llm(messages)
+                
+                # 生成总结
+                summary = await get_llm_summary(formatted_messages)
+        finally:
+            # 确保提示消息先于结果发出
+            await notice_task
         
         if not messages:
             await summary_cmd.finish("❌ 近期暂无有效聊天记录")
         
-        # 格式化消息
-        formatted_messages = await format_messages_for_llm(messages, bot, group_id)
-        
-        # 生成总结
-        summary = await get_llm_summary(formatted_messages)
-        
         # 统计信息
         valid_count = len(messages)
         
-        # 判断数据来源（是否为10分钟内数据）
-        time_limit = datetime.now() - timedelta(minutes=10)
-        recent_count = 0
-        for msg in messages:
-            # 解析消息时间
-            created_at = msg.created_at
-            if isinstance(created_at, str):
-                try:
-                    # 处理ISO格式时间字符串
-                    msg_time = datetime.fromisoformat(created_at.replace('Z', '+00:00'))
-                    # 如果有时区信息，转换为本地时间
-                    if msg_time.tzinfo:
-                        msg_time = msg_time.replace(tzinfo=None)
-                    
-                    if msg_time >= time_limit:
-                        recent_count += 1
-                except:
-                    continue
-        
         if recent_count == valid_count and valid_count < 100:
             # 全部都是10分钟内的消息
             stats_text = f"分析了近10分钟内的{valid_count}条有效消息"
@@ -311,11 +317,11 @@ async def handle_summary(bot: Bot, event: GroupMessageEvent):
             stats_text = f"近10分钟无消息，分析了最近{valid_count}条有效历史消息"
         
         # 生成图片
-        img_bytes = create_summary_image(summary, stats_text)
+        # Pillow 绘制和图片编码放到线程中执行，避免阻塞事件循环
+        img_buffer = await asyncio.to_thread(create_summary_image, summary, stats_text)
         
-        # 发送图片
-        img_base64 = base64.b64encode(img_bytes).decode()
-        img_segment = MessageSegment.image(f"base64://{img_base64}")
+        # 发送图片：直接交给适配器，由其按 OneBot 协议编码
+        img_segment = MessageSegment.image(img_buffer)
         
         await summary_cmd.finish(Message(img_segment))
         
@@ -4,12 +4,25 @@ from nonebot.typing import T_State
 from nonebot.plugin import PluginMetadata
 from datetime import datetime, timedelta
 from collections import defaultdict
+from cachetools import TTLCache
 from utils.rules import allow_group_rule
 
+import os
 import json
+import heapq
 import asyncio
 from pathlib import Path
 
+from sqlalchemy import MetaData, Table, Column, BigInteger, Integer, select, func
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import create_async_engine
+
+try:
+    import orjson
+    loads_json = orjson.loads
+except ImportError:
+    loads_json = json.loads
+
 __plugin_meta__ = PluginMetadata(
     name="水群统计",
     description="统计群成员在水群中的活跃度",
@@ -19,11 +32,27 @@ __plugin_meta__ = PluginMetadata(
 
 # 数据文件路径
 DATA_DIR = Path("data")
+# 旧版本的 JSON 数据文件，首次启动时迁移到数据库
 DATA_FILE = DATA_DIR / "group_stats.json"
 
 # 确保数据目录存在
 DATA_DIR.mkdir(exist_ok=True)
 
+# 历史总统计存放在 SQLite 中，每次只写入有变化的行
+STATS_DB_URL = os.getenv("WATER_TIME_DB_URL", "sqlite+aiosqlite:///data/group_stats.db")
+metadata = MetaData()
+stats_table = Table(
+    "stats", metadata,
+    Column("group_id", BigInteger, primary_key=True),
+    Column("user_id", BigInteger, primary_key=True),
+    Column("total_active_minutes", Integer, nullable=False, default=0),
+    Column("total_msg_count", Integer, nullable=False, default=0),
+)
+engine = create_async_engine(STATS_DB_URL, echo=False)
+
+# 自上次保存以来历史总计有变化的 (group_id, user_id)
+_dirty = set()
+
 # 维护统计数据的全局字典
 # 默认格式: group_id -> user_id -> stats dict
 group_stats = defaultdict(lambda: defaultdict(lambda: {
@@ -34,49 +63,98 @@ group_stats = defaultdict(lambda: defaultdict(lambda: {
     "total_active_minutes": 0,
 }))
 
-def current_minute_str() -> str:
-    return datetime.now().strftime("%Y-%m-%d %H:%M")
-
 def current_date_str() -> str:
     return datetime.now().strftime("%Y-%m-%d")
 
-state = {"current_date": current_date_str()}
+def day_bounds(timestamp: int) -> tuple:
+    """返回时间戳所在本地自然日的起止时间戳 [start, end)"""
+    day_start = datetime.fromtimestamp(timestamp).replace(hour=0, minute=0, second=0, microsecond=0)
+    return int(day_start.timestamp()), int((day_start + timedelta(days=1)).timestamp())
+
+# last_speak_minute 以 Unix 时间戳的分钟数（timestamp // 60）记录，间隔直接做整数减法
+_today_start, _today_end = day_bounds(int(datetime.now().timestamp()))
+state = {"current_date": current_date_str(), "day_start": _today_start, "day_end": _today_end}
+
+def read_data_file():
+    """读取并解析旧版 JSON 数据文件（文件 I/O，在线程中执行）"""
+    if not DATA_FILE.exists():
+        return None
+    with open(DATA_FILE, 'rb') as f:
+        return loads_json(f.read())
+
+async def _upsert(conn, rows: list):
+    """按 (group_id, user_id) 写入历史总计，已存在的行直接更新"""
+    stmt = sqlite_insert(stats_table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[stats_table.c.group_id, stats_table.c.user_id],
+        set_={
+            "total_active_minutes": stmt.excluded.total_active_minutes,
+            "total_msg_count": stmt.excluded.total_msg_count,
+        },
+    )
+    await conn.execute(stmt, rows)
+
+async def _migrate_json(conn):
+    """数据库为空且存在旧版 JSON 文件时，将其中的历史总计导入数据库"""
+    if await conn.scalar(select(func.count()).select_from(stats_table)):
+        return
+    data = await asyncio.to_thread(read_data_file)
+    if not data:
+        return
+    rows = [
+        {
+            "group_id": int(group_id),
+            "user_id": int(user_id),
+            "total_active_minutes": stats.get("total_active_minutes", 0),
+            "total_msg_count": stats.get("total_msg_count", 0),
+        }
+        for group_id, users in data.items()
+        for user_id, stats in users.items()
+    ]
+    if rows:
+        await _upsert(conn, rows)
+        logger.info(f"已从 {DATA_FILE} 迁移 {len(rows)} 条历史数据到数据库")
 
-def load_data():
-    """从文件加载历史数据"""
-    global group_stats
+async def load_data():
+    """从数据库加载历史数据"""
     try:
-        if DATA_FILE.exists():
-            with open(DATA_FILE, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                # 重构为defaultdict格式，只加载历史数据
-                for group_id, users in data.items():
-                    for user_id, stats in users.items():
-                        group_stats[int(group_id)][int(user_id)].update({
-                            "total_active_minutes": stats.get("total_active_minutes", 0),
-                            "total_msg_count": stats.get("total_msg_count", 0)
-                        })
-                logger.info(f"已加载历史数据: {len(data)} 个群组")
+        async with engine.begin() as conn:
+            await conn.run_sync(metadata.create_all)
+            await _migrate_json(conn)
+            rows = (await conn.execute(select(stats_table))).all()
+        # 重构为defaultdict格式，只加载历史数据
+        for row in rows:
+            group_stats[row.group_id][row.user_id].update({
+                "total_active_minutes": row.total_active_minutes,
+                "total_msg_count": row.total_msg_count
+            })
+        logger.info(f"已加载历史数据: {len(rows)} 条")
     except Exception as e:
         logger.error(f"加载数据失败: {e}")
 
-def save_data():
-    """保存历史总数据到文件"""
+async def save_data():
+    """将有变化的历史总统计写入数据库"""
+    if not _dirty:
+        return
+    # 在事件循环中取快照并清空脏集合，写入期间新产生的变化留到下次保存
+    keys = list(_dirty)
+    _dirty.clear()
+    rows = []
+    for group_id, user_id in keys:
+        stats = group_stats[group_id][user_id]
+        rows.append({
+            "group_id": group_id,
+            "user_id": user_id,
+            "total_active_minutes": stats["total_active_minutes"],
+            "total_msg_count": stats["total_msg_count"],
+        })
     try:
-        # 只保存历史总统计
-        data = {}
-        for group_id, users in group_stats.items():
-            data[str(group_id)] = {}
-            for user_id, stats in users.items():
-                data[str(group_id)][str(user_id)] = {
-                    "total_active_minutes": stats["total_active_minutes"],
-                    "total_msg_count": stats["total_msg_count"]
-                }
-        
-        with open(DATA_FILE, 'w', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
-        logger.info(f"历史数据已保存到 {DATA_FILE}")
+        async with engine.begin() as conn:
+            await _upsert(conn, rows)
+        logger.info(f"历史数据已保存: {len(rows)} 条")
     except Exception as e:
+        # 写入失败时放回脏集合，下次保存重试
+        _dirty.update(keys)
         logger.error(f"保存数据失败: {e}")
 
 async def recover_today_stats():
@@ -105,8 +183,6 @@ async def recover_today_stats():
                     limit=10000,  # 获取足够多的消息
                     order_by="asc"
                 )
-
-                today_messages =[ msg.to_dict() for msg in today_messages]
                 
                 if not today_messages:
                     continue
@@ -153,25 +229,16 @@ async def recover_today_stats():
                         else:
                             continue
                         
-                        current_minute = msg_time.strftime("%Y-%m-%d %H:%M")
+                        current_minute = int(msg_time.timestamp()) // 60
                         
                         # 添加当前分钟到活跃分钟集合
                         active_minutes_set.add(current_minute)
                         
                         # 如果与上一条消息间隔不超过3分钟，填充中间的分钟
-                        if last_active_minute:
-                            try:
-                                last_time = datetime.strptime(last_active_minute, "%Y-%m-%d %H:%M")
-                                time_diff = (msg_time - last_time).total_seconds() / 60
-                                
-                                if 0 < time_diff <= 3:
-                                    # 填充中间的分钟
-                                    for i in range(1, int(time_diff)):
-                                        fill_time = last_time + timedelta(minutes=i)
-                                        fill_minute = fill_time.strftime("%Y-%m-%d %H:%M")
-                                        active_minutes_set.add(fill_minute)
-                            except:
-                                pass
+                        if last_active_minute is not None:
+                            time_diff = current_minute - last_active_minute
+                            if 0 < time_diff <= 3:
+                                active_minutes_set.update(range(last_active_minute + 1, current_minute))
                         
                         last_active_minute = current_minute
                     
@@ -195,18 +262,21 @@ async def recover_today_stats():
     except Exception as e:
         logger.error(f"恢复当日水群统计失败: {e}")
 
+# 后台保存任务的引用，防止任务在完成前被垃圾回收
+_background_tasks = set()
+
 async def periodic_save():
     """定期保存历史数据并更新总计"""
     while True:
         await asyncio.sleep(15 * 60)  # 15分钟
-        save_data()
+        await save_data()
 
 # 启动时加载数据
 driver = get_driver()
 
 @driver.on_startup
 async def startup():
-    load_data()
+    await load_data()
     # 启动定期保存任务
     asyncio.create_task(periodic_save())
     
@@ -219,32 +289,35 @@ async def startup():
 
 @driver.on_shutdown
 async def shutdown():
-    save_data()
+    await save_data()
+    await engine.dispose()
 
 # 每条群消息触发，更新统计
 water_time = on_message(rule=allow_group_rule, priority=2, block=False)
 
 @water_time.handle()
 async def handle_water_time(event: GroupMessageEvent):
-    global group_stats, state
+    global state
     group_id = event.group_id
     user_id = event.user_id
-    now_minute = current_minute_str()
-    message_time = datetime.fromtimestamp(event.time).strftime("%Y-%m-%d")
+    now_minute = event.time // 60
     
-    if message_time != state["current_date"]:
-        # 如果消息时间不是今天，重置统计并更新历史总计
-        save_data()
-        group_stats = defaultdict(lambda: defaultdict(lambda: {
-            "active_minutes": 0,
-            "msg_count": 0,
-            "last_speak_minute": None,
-            "total_msg_count": 0,
-            "total_active_minutes": 0,
-        }))
-        load_data()
+    # 只在消息时间落到当天范围之外时才做日期换算
+    if not state["day_start"] <= event.time < state["day_end"]:
+        message_time = datetime.fromtimestamp(event.time).strftime("%Y-%m-%d")
+        # 如果消息时间不是今天，原地重置当日统计，历史总计保留在内存中不变；
+        # 有变化的总计在后台任务中写入数据库，不阻塞事件循环
+        task = asyncio.create_task(save_data())
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
+        for users in group_stats.values():
+            for user_stats in users.values():
+                user_stats["active_minutes"] = 0
+                user_stats["msg_count"] = 0
+                user_stats["last_speak_minute"] = None
         # 重置当前日期
         state["current_date"] = message_time
+        state["day_start"], state["day_end"] = day_bounds(event.time)
         # 重新恢复当日统计
         asyncio.create_task(recover_today_stats())
 
@@ -257,6 +330,7 @@ async def handle_water_time(event: GroupMessageEvent):
     # 增加消息数
     user_stats["msg_count"] += 1
     user_stats["total_msg_count"] += 1
+    _dirty.add((group_id, user_id))
 
     # 判断是否新增"水群分钟"
     if user_stats["last_speak_minute"] != now_minute:
@@ -265,23 +339,15 @@ async def handle_water_time(event: GroupMessageEvent):
             user_stats["active_minutes"] += 1
             user_stats["total_active_minutes"] += 1
         else:
-            # 计算时间间隔
-            try:
-                last_time = datetime.strptime(last_minute, "%Y-%m-%d %H:%M")
-                current_time = datetime.strptime(now_minute, "%Y-%m-%d %H:%M")
-                time_diff = (current_time - last_time).total_seconds() / 60
-                
-                if time_diff <= 3:
-                    # 间隔不超过3分钟，这期间都在水群
-                    minutes_to_add = int(time_diff)
-                    user_stats["active_minutes"] += minutes_to_add
-                    user_stats["total_active_minutes"] += minutes_to_add
-                else:
-                    # 间隔超过3分钟，只算当前分钟
-                    user_stats["active_minutes"] += 1
-                    user_stats["total_active_minutes"] += 1
-            except:
-                # 解析时间失败，只算当前分钟
+            # 计算时间间隔（分钟）
+            time_diff = now_minute - last_minute
+            
+            if time_diff <= 3:
+                # 间隔不超过3分钟，这期间都在水群
+                user_stats["active_minutes"] += time_diff
+                user_stats["total_active_minutes"] += time_diff
+            else:
+                # 间隔超过3分钟，只算当前分钟
                 user_stats["active_minutes"] += 1
                 user_stats["total_active_minutes"] += 1
         
@@ -332,11 +398,12 @@ async def handle_stats(bot: Bot, event: GroupMessageEvent, state: T_State):
         await stats_cmd.finish(msg)
     else:
         # 没有at，则显示所有成员排名（最多10个）
-        ranking = sorted(stats_data.items(), key=lambda x: x[1]["active_minutes"], reverse=True)
+        # 只需前 10 名，用堆选取而不是对全部成员排序
+        ranking = heapq.nlargest(10, stats_data.items(), key=lambda x: x[1]["active_minutes"])
         msg_lines = ["🏆 今日群聊活跃度排行榜", "━━━━━━━━━━━━━━━━━"]
-        coros = [get_user_name(bot, group_id, uid) for uid, _ in ranking[:10]]
+        coros = [get_user_name(bot, group_id, uid) for uid, _ in ranking]
         names = await asyncio.gather(*coros)
-        for i, ((uid, data), name) in enumerate(zip(ranking[:10], names), 1):
+        for i, ((uid, data), name) in enumerate(zip(ranking, names), 1):
             if i == 1:
                 rank_emoji = "🥇"
             elif i == 2:
@@ -351,13 +418,22 @@ async def handle_stats(bot: Bot, event: GroupMessageEvent, state: T_State):
 
         await stats_cmd.finish("\n".join(msg_lines))
 
+# 成员名称缓存：(group_id, user_id) -> 显示名称，10 分钟内复用，排行榜刷新时不必逐个请求
+_name_cache: TTLCache = TTLCache(maxsize=2048, ttl=600)
+
 async def get_user_name(bot: Bot, group_id: int, user_id: int):
+    name = _name_cache.get((group_id, user_id))
+    if name is not None:
+        return name
     try:
         member_info = await bot.get_group_member_info(
             group_id=group_id,
             user_id=user_id,
-            no_cache=True
+            no_cache=False
         )
-        return member_info.get("card") or member_info.get("nickname") or str(user_id)
     except:
-        return str(user_id)
\ No newline at end of file
+        # 查询失败时不缓存，下次再试
+        return str(user_id)
+    name = member_info.get("card") or member_info.get("nickname") or str(user_id)
+    _name_cache[(group_id, user_id)] = name
+    return name
\ No newline at end of file
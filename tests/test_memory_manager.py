@@ -48,6 +48,26 @@ class TestMemoryManager:
         assert isinstance(args[0], MemoryItem)
         assert args[0].content == "test content"
 
+    def test_add_memories_bulk(self, manager):
+        manager.memory_types["working"].add_many.return_value = ["id-1", "id-2"]
+
+        ids = manager.add_memories([
+            {"content": "first", "user_id": "u1"},
+            {"content": "second", "metadata": {"source": "test"}},
+        ])
+
+        assert ids == ["id-1", "id-2"]
+        manager.memory_types["working"].add_many.assert_called_once()
+        args, _ = manager.memory_types["working"].add_many.call_args
+        items = args[0]
+        assert [item.content for item in items] == ["first", "second"]
+        assert items[0].user_id == "u1"
+        assert items[1].user_id == "default_user"
+        assert items[1].metadata == {"source": "test"}
+
+        with pytest.raises(ValueError):
+            manager.add_memories([{"content": "x"}], memory_type="invalid_type")
+
     def test_add_memory_invalid_type(self, manager):
         with pytest.raises(ValueError):
             manager.add_memory("content", memory_type="invalid_type")
@@ -89,10 +109,11 @@ class TestMemoryManager:
             # 添加第二个记忆，应该触发 mem1 的遗忘
             manager.add_memory("mem2", "working")
             
-            # 验证 EpisodicMemory.add 被调用
-            mock_episodic_instance.add.assert_called()
-            args, _ = mock_episodic_instance.add.call_args
-            item = args[0]
+            # 验证被遗忘的记忆通过 EpisodicMemory.add_many 批量转移
+            mock_episodic_instance.add_many.assert_called_once()
+            args, _ = mock_episodic_instance.add_many.call_args
+            assert len(args[0]) == 1
+            item = args[0][0]
             assert item.content == "mem1"
             assert item.memory_type == "episodic"
 
@@ -125,7 +146,7 @@ class TestMemoryManager:
         mock_semantic = manager.memory_types["semantic"]
         
         # Action
-        await manager.consolidate_memories(mock_llm, limit=5)
+        processed = await manager.consolidate_memories(mock_llm, limit=5)
         
         # Assert
         # 1. Check LLM called
@@ -141,3 +162,6 @@ class TestMemoryManager:
         
         # 3. Check Episodic marked
         mock_episodic.mark_as_consolidated.assert_called_once_with(["ep-1"])
+
+        # 4. Check processed count returned
+        assert processed == 1
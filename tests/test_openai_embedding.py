@@ -17,6 +17,54 @@ if PROJECT_ROOT not in sys.path:
 
 from chat.memory.embedding import OpenAIEmbeddingModel  # noqa: E402
 
+
+class _FakeResponse:
+    def __init__(self, embeddings: List[List[float]]):
+        class _Item:
+            def __init__(self, emb):
+                self.embedding = emb
+
+        self.data = [_Item(e) for e in embeddings]
+
+
+class _RecordingSyncClient:
+    """记录每次请求收到的文本批次；以文本本身编码成一维向量，便于校验顺序"""
+
+    def __init__(self):
+        self.inputs = []
+
+    @property
+    def calls(self) -> int:
+        return len(self.inputs)
+
+    class _Embeddings:
+        def __init__(self, outer):
+            self._outer = outer
+
+        def create(self, model, input):  # type: ignore[override]
+            self._outer.inputs.append(list(input))
+            return _FakeResponse([[float(t)] for t in input])
+
+    @property
+    def embeddings(self):
+        return _RecordingSyncClient._Embeddings(self)
+
+
+@pytest.fixture
+def recording_model_factory(monkeypatch):
+    """构造替换了 sync_client 的 OpenAIEmbeddingModel，返回 (model, fake_client)"""
+    monkeypatch.setenv("EMBEDDING_MODEL", "test-embedding-model")
+    monkeypatch.setenv("EMBEDDING_API_KEY", "DUMMY_KEY")
+    monkeypatch.setenv("EMBEDDING_BASE_URL", "https://test.local")
+
+    def factory(**kwargs):
+        model = OpenAIEmbeddingModel(**kwargs)
+        fake_client = _RecordingSyncClient()
+        object.__setattr__(model, "_sync_client", fake_client)
+        return model, fake_client
+
+    return factory
+
 @pytest.mark.embedding
 def test_openai_embedding_sync_single(monkeypatch):
     """测试 OpenAIEmbeddingModel 同步 encode 单条文本。
@@ -154,3 +202,38 @@ def test_openai_embedding_async_many(monkeypatch):
     assert vecs[0] == [1.0, 0.0]
     assert vecs[1] == [0.0, 1.0]
     assert model.dimension == 2
+
+
+@pytest.mark.embedding
+def test_openai_embedding_sync_many_batched(recording_model_factory):
+    """测试多条文本按 batch_size 分批请求，并按原顺序拼接结果。"""
+
+    model, fake_client = recording_model_factory(batch_size=2)
+
+    vecs = model.encode(["1", "2", "3", "4", "5"])
+
+    assert fake_client.inputs == [["1", "2"], ["3", "4"], ["5"]]
+    assert vecs == [[1.0], [2.0], [3.0], [4.0], [5.0]]
+    assert model.encode([]) == []
+
+
+@pytest.mark.embedding
+def test_openai_embedding_cache_skips_repeated_texts(recording_model_factory):
+    """测试 LRU 缓存：重复文本不再请求接口，超出容量后淘汰最久未使用的条目。"""
+
+    model, fake_client = recording_model_factory(cache_size=2)
+
+    # 同一批内重复文本只请求一次
+    assert model.encode(["1", "2", "1"]) == [[1.0], [2.0], [1.0]]
+    assert fake_client.calls == 1
+    assert fake_client.inputs == [["1", "2"]]
+
+    # 全部命中缓存，不再发起请求
+    assert model.encode("2") == [2.0]
+    assert fake_client.calls == 1
+
+    # 容量为 2，写入 "3" 后最久未使用的 "1" 被淘汰
+    model.encode("3")
+    model.encode(["1", "2"])
+    assert fake_client.calls == 3
+    assert fake_client.inputs == [["1", "2"], ["3"], ["1"]]
@@ -0,0 +1,50 @@
+import time
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from chat.agents.reply_cache import SemanticReplyCache
+
+
+@pytest.fixture
+def cache():
+    # Mock 掉嵌入模型和向量库，避免连接外部服务
+    with patch("chat.agents.reply_cache.get_text_embedder") as mock_embedder, \
+         patch("chat.agents.reply_cache.get_dimension", return_value=3), \
+         patch("chat.agents.reply_cache.QdrantConnectionManager") as MockManager:
+        mock_embedder.return_value.encode.return_value = [0.1, 0.2, 0.3]
+        MockManager.get_instance.return_value = MagicMock()
+        yield SemanticReplyCache(threshold=0.9, ttl=60)
+
+
+@pytest.mark.cache
+def test_lookup_hit_filters_by_group(cache):
+    cache.vector_store.search_vectors.return_value = [
+        {"id": "p1", "score": 0.95, "metadata": {"answer": "cached", "timestamp": int(time.time())}}
+    ]
+
+    assert cache.lookup("g1", "question") == "cached"
+    _, kwargs = cache.vector_store.search_vectors.call_args
+    assert kwargs["where"] == {"group_id": "g1"}
+    assert kwargs["score_threshold"] == 0.9
+
+
+@pytest.mark.cache
+def test_lookup_expired_entry_is_deleted(cache):
+    cache.vector_store.search_vectors.return_value = [
+        {"id": "p1", "score": 0.99, "metadata": {"answer": "stale", "timestamp": int(time.time()) - 120}}
+    ]
+
+    assert cache.lookup("g1", "question") is None
+    cache.vector_store.delete_vector.assert_called_once_with(["p1"])
+
+
+@pytest.mark.cache
+def test_store_uses_stable_point_id(cache):
+    cache.store("g1", "question", "answer")
+    cache.store("g1", "question", "answer2")
+
+    first = cache.vector_store.add_vector.call_args_list[0].kwargs
+    second = cache.vector_store.add_vector.call_args_list[1].kwargs
+    assert first["ids"] == second["ids"]
+    assert second["metadatas"][0] == {"group_id": "g1", "query": "question", "answer": "answer2"}
@@ -108,6 +108,35 @@ def test_search_memories(store: SQLiteDocumentStore):
     assert all(m["timestamp"] >= mid_ts for m in ranged)
 
 
+@pytest.mark.sqlite
+def test_add_memories_bulk(store: SQLiteDocumentStore):
+    """测试批量添加记忆。"""
+    ts = int(datetime.now().timestamp())
+
+    ids = store.add_memories([
+        {
+            "memory_id": f"m_sqlite_bulk_{i}",
+            "user_id": "u_bulk",
+            "group_id": "g_bulk",
+            "content": f"bulk_{i}",
+            "memory_type": "episodic",
+            "timestamp": ts + i,
+            "properties": {"idx": i},
+        }
+        for i in range(3)
+    ])
+
+    assert ids == [f"m_sqlite_bulk_{i}" for i in range(3)]
+    results = store.search_memories(user_id="u_bulk", group_id="g_bulk", limit=10)
+    assert len(results) == 3
+
+    got = store.get_memory("m_sqlite_bulk_1")
+    assert got["content"] == "bulk_1"
+    assert got["properties"]["idx"] == 1
+
+    assert store.add_memories([]) == []
+
+
 @pytest.mark.sqlite
 def test_update_memory(store: SQLiteDocumentStore):
     """测试更新记忆内容和属性。"""
@@ -108,6 +108,27 @@ def test_working_memory_capacity_and_token_limits():
     assert "1" not in ids
 
 
+@pytest.mark.memory
+def test_working_memory_add_many_enforces_limits_once():
+    config = MemoryConfig(working_memory_capacity=2, working_memory_tokens=100)
+    wm = WorkingMemory(config)
+
+    now = datetime.now()
+    items = [
+        MemoryItem(id=str(i), content=f"msg {i}", memory_type="working", group_id="g", user_id="u", timestamp=now, metadata={})
+        for i in range(3)
+    ]
+
+    ids = wm.add_many(items)
+    assert ids == ["0", "1", "2"]
+
+    # 超出容量时仅保留最新的两条
+    assert {m.id for m in wm.get_all()} == {"1", "2"}
+    assert wm.current_tokens == 4
+
+    assert wm.add_many([]) == []
+
+
 @pytest.mark.memory
 def test_working_memory_stats_and_recent():
     config = MemoryConfig(working_memory_capacity=10, working_memory_tokens=100)
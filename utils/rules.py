@@ -9,14 +9,15 @@ import ast
 
 CONFIG_PATH = Path(__file__).parent.parent / "config.yaml"
 
-def load_allowed_groups():
+def load_allowed_groups() -> frozenset:
+    """读取允许的群列表，统一为字符串群号的 frozenset，便于 O(1) 判断"""
     value = os.getenv('allowed_groups', "")
     if not value:
-        return []
+        return frozenset()
     try:
-        return json.loads(value)
+        return frozenset(map(str, json.loads(value)))
     except json.JSONDecodeError:
-        return []
+        return frozenset()
 
 allowed_groups = load_allowed_groups()
 